@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import itertools
+import logging
+import timeit
+
+from sklearn.feature_extraction.text import strip_accents_ascii
+
+from yatiri import datastore
+from yatiri.keys import next_key
+from yatiri.text import (
+    normalize_text, normalize_text_cached, remove_non_ascii,
+)
+
+
+logger = logging.getLogger(__file__)
+
+
+def legacy_normalize_text(text):
+    if isinstance(text, str):
+        text = text.decode('utf-8')
+    return remove_non_ascii(strip_accents_ascii(text))
+
+
+def load_values(prefix, field, limit):
+    db = datastore.corpus_db()
+    it = db.range(prefix, next_key(prefix)) if prefix else db.range()
+    values = (doc.get(field) for key, doc in it)
+    return list(itertools.islice(itertools.ifilter(None, values), limit))
+
+
+def bench(func, values, repeat):
+    timer = timeit.Timer(lambda: map(func, values))
+    return min(timer.repeat(repeat, 1))
+
+
+def main(args):
+    for field in args.fields:
+        values = load_values(args.prefix, field, args.limit)
+        if not values:
+            print "No values for field {}".format(field)
+            continue
+
+        mismatches = sum(1 for v in values
+                         if legacy_normalize_text(v) != normalize_text(v))
+        size = sum(len(v) for v in values) / 2.0**20
+
+        print "{}: {} values, {:.2f} M chars, {} mismatches".format(
+            field, len(values), size, mismatches)
+
+        baseline = bench(legacy_normalize_text, values, args.repeat)
+        for name, func in (('legacy', legacy_normalize_text),
+                           ('table', normalize_text),
+                           ('table+memo', normalize_text_cached)):
+            elapsed = bench(func, values, args.repeat)
+            print "  {:12} {:8.3f}s {:8.2f} M chars/s {:6.1f}x".format(
+                name, elapsed, size / elapsed, baseline / elapsed)
+
+
+if __name__ == '__main__':
+    from yatiri.log import setup_logging; setup_logging()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('prefix', nargs='?', help="key prefix")
+    parser.add_argument('-f', '--field', dest='fields', nargs='*',
+                        default=['site', 'headline', 'body'])
+    parser.add_argument('-l', '--limit', type=int, default=10000)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+    main(args)
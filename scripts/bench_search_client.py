@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares search latencies opening a connection per request against the
+pooled SearchClient. Requires a running search service."""
+import argparse
+import json
+import time
+
+from urllib import urlencode
+from urlparse import urljoin
+from cyclone import httpclient
+from twisted.internet import defer, task
+
+from yatiri import settings
+from yatiri.searchclient import SearchClient
+
+
+CATEGORIES = ('seguridad', 'conflictos', 'politica')
+
+
+class FetchClient(object):
+    """Former client: a new connection per request."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+    @defer.inlineCallbacks
+    def search(self, query, categories=(), **kwargs):
+        kwargs.update({'q': query, 'category': categories})
+        url = urljoin(self.endpoint, '/search?{}'.format(
+            urlencode(kwargs, doseq=1)))
+        result = yield httpclient.fetch(url)
+        defer.returnValue(json.loads(result.body))
+
+    def multi_search(self, queries):
+        return defer.gatherResults([self.search(**kw) for kw in queries])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+@defer.inlineCallbacks
+def bench(client, args):
+    latencies = []
+    sem = defer.DeferredSemaphore(args.concurrency)
+
+    @defer.inlineCallbacks
+    def timed(i):
+        start = time.time()
+        if args.multi:
+            yield client.multi_search([
+                dict(query=args.query, categories=[c], limit=args.limit)
+                for c in CATEGORIES
+            ])
+        else:
+            yield client.search(args.query, [CATEGORIES[i % 3]],
+                                limit=args.limit)
+        latencies.append(time.time() - start)
+
+    start = time.time()
+    yield defer.gatherResults([
+        sem.run(timed, i) for i in xrange(args.requests)
+    ])
+    elapsed = time.time() - start
+    defer.returnValue((elapsed, latencies))
+
+
+@defer.inlineCallbacks
+def main(reactor, args):
+    clients = [
+        ('fetch', FetchClient(args.endpoint)),
+        ('pooled', SearchClient(args.endpoint, pool_size=args.concurrency)),
+    ]
+    for name, client in clients:
+        # warm up
+        yield client.search(args.query, limit=args.limit)
+        elapsed, latencies = yield bench(client, args)
+        print "{:>8}: {:.1f} req/s, mean {:.2f} ms, p50 {:.2f} ms, " \
+              "p95 {:.2f} ms".format(
+                  name, len(latencies) / elapsed,
+                  1000 * sum(latencies) / len(latencies),
+                  1000 * percentile(latencies, .5),
+                  1000 * percentile(latencies, .95))
+        if hasattr(client, 'close'):
+            yield client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--endpoint', default=settings.SEARCH_ENDPOINT)
+    parser.add_argument('-q', '--query', default='')
+    parser.add_argument('-n', '--requests', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--multi', action='store_true',
+                        help="time a multi_search of the home categories")
+    args = parser.parse_args()
+    task.react(main, [args])
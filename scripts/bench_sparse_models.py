@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import logging
+import multiprocessing
+import resource
+
+from sklearn import metrics
+from sklearn.datasets import load_files
+
+from yatiri.classification import (
+    build_model_d,
+    build_model_f,
+    build_model_g,
+    build_model_h,
+)
+from yatiri.timing import Timer
+
+
+logger = logging.getLogger(__file__)
+
+
+# (name, builder, parameters) dense models followed by their sparse
+# counterparts
+MODELS = (
+    ('randomforest', build_model_d, {}),
+    ('randomforestsparse', build_model_g, {}),
+    ('basescaled', build_model_f, {}),
+    ('basescaledsparse', build_model_h, {}),
+)
+
+VECT_PARAMETERS = {
+    'vect__max_df': 0.5,
+    'vect__min_df': 3,
+    'vect__ngram_range': (1, 4),
+}
+
+
+def peak_rss():
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def run_model(builder, params, data, queue):
+    # runs in a child process so peak memory is measured per model
+    train_data, train_target, test_data, test_target = data
+    baseline = peak_rss()
+    model = builder()
+    model.set_params(**VECT_PARAMETERS)
+    model.set_params(**params)
+    timer = Timer()
+    with timer:
+        model.fit(train_data, train_target)
+        pred = model.predict(test_data)
+    queue.put({
+        'f1': metrics.f1_score(test_target, pred),
+        'elapsed': timer.elapsed,
+        'baseline': baseline,
+        'peak': peak_rss(),
+    })
+
+
+def load_data(path, train_size):
+    dataset = load_files(path)
+    docs = [json.loads(raw) for raw in dataset.data]
+    size = int(len(docs) * train_size)
+    return (docs[:size], dataset.target[:size],
+            docs[size:], dataset.target[size:])
+
+
+def main(args):
+    data = load_data(args.train_path, args.train_size)
+    print "{} documents (training set)".format(len(data[0]))
+
+    print "{:20} {:>8} {:>10} {:>10} {:>10}".format(
+        'model', 'f1', 'time (s)', 'peak (MB)', 'delta (MB)')
+    for name, builder, params in MODELS:
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=run_model,
+                                       args=(builder, params, data, queue))
+        proc.start()
+        result = queue.get()
+        proc.join()
+        print "{:20} {:8.3f} {:10.2f} {:10.1f} {:10.1f}".format(
+            name, result['f1'], result['elapsed'], result['peak'],
+            result['peak'] - result['baseline'])
+
+
+if __name__ == '__main__':
+    from yatiri.log import setup_logging; setup_logging()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_path')
+    parser.add_argument('--train-size', type=float, default=.5)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import logging
+
+from yatiri.batch.classify import classify, BATCH_SIZE
+from yatiri.timing import Timer
+
+
+logger = logging.getLogger(__file__)
+
+
+def main(args):
+    timer = Timer()
+    with timer:
+        count = classify(args.model, args.prefix, workers=args.workers,
+                         batch_size=args.batch_size)
+    print "Classified {} documents in {:.1f} seconds".format(
+        count, timer.elapsed)
+
+
+if __name__ == '__main__':
+    from yatiri.log import setup_logging; setup_logging()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('model', help="registered model, as name[:version]")
+    parser.add_argument('prefix', nargs='?', default='news:',
+                        help="key prefix")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="number of prediction processes")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    main(args)
@@ -13,28 +13,50 @@ from yatiri.utils import report_progress
 logger = logging.getLogger(__file__)
 
 
+def iter_file_labels(filepath):
+    with open(filepath) as fp:
+        for line in fp:
+            key, cat = line.strip().split('\t')
+            cat = eval(cat)
+            if isinstance(cat, list):
+                cat = cat[0]
+            yield key, cat
+
+
+def iter_db_labels(prefix):
+    db = datastore.labels_db()
+    for key, label in db.range(prefix, next_key(prefix)):
+        yield key, label['category']
+
+
 def main(args):
     indexer = search.IndexerContext(settings.XAPIAN_DB)
     with indexer as conn:
         search.create_index(conn)
 
+    if args.from_labels:
+        labels = iter_db_labels(args.from_labels)
+    else:
+        labels = iter_file_labels(args.file)
+
     count = 0
-    with indexer as conn, open(args.file) as fp:
-        for count, line in enumerate(report_progress(fp)):
-            key, cat = line.strip().split('\t')
-            cat = eval(cat)
-            if isinstance(cat, list):
-                cat = cat[0]
+    with indexer as conn:
+        for count, (key, cat) in enumerate(report_progress(labels)):
             doc = conn.get_document(key)
             doc.add_term('category', cat)
             indexer.conn.replace(doc)
 
+    search.bump_generation(settings.XAPIAN_DB)
     print "Updated {} documents".format(count)
 
 
 if __name__ == '__main__':
     from yatiri.log import setup_logging; setup_logging()
     parser = argparse.ArgumentParser()
-    parser.add_argument('file')
+    parser.add_argument('file', nargs='?')
+    parser.add_argument('--from-labels', metavar='PREFIX',
+                        help="read categories from the labels db")
     args = parser.parse_args()
+    if not (args.file or args.from_labels):
+        parser.error("either file or --from-labels is required")
     main(args)
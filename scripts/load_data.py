@@ -1,7 +1,13 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import argparse
-from yatiri.batch.load import load_csv, load_jsonlines
+import os
+from yatiri.batch.inputs import (
+    STDIN, FORMATS, OPENERS, detect_format, expand_paths, file_signature,
+    open_input,
+)
+from yatiri.batch.load import load_csv, load_jsonlines, clear_checkpoint
+from yatiri.timing import Timer
 from yatiri.utils import report_progress
 
 
@@ -12,20 +18,57 @@ EXT_FORMAT = {
 
 
 def main(args):
-    for filepath in args.files:
+    for filepath in expand_paths(args.files):
+        if filepath == STDIN:
+            fmt, compression = args.format, args.compression
+        else:
+            fmt, compression = detect_format(filepath)
         try:
-            load_func = EXT_FORMAT[filepath.rpartition('.')[-1]]
+            load_func = EXT_FORMAT[fmt]
         except KeyError:
             print "Unrecognized format extension: {}".format(filepath)
+            continue
+
+        # stdin can't be resumed
+        if filepath == STDIN:
+            checkpoint = signature = None
         else:
-            with open(filepath, 'rb') as fp:
-                count = load_func(report_progress(open(filepath, 'rb')))
-                print "Loaded {} documents from {}".format(count, filepath)
+            checkpoint = os.path.abspath(filepath)
+            signature = file_signature(filepath)
+            if args.restart:
+                clear_checkpoint(checkpoint)
+
+        timer = Timer()
+        with open_input(filepath, compression) as stream:
+            with timer:
+                count = load_func(stream, workers=args.workers,
+                                  checkpoint=checkpoint,
+                                  progress=report_progress,
+                                  incremental=args.incremental,
+                                  signature=signature)
+
+        elapsed = max(timer.elapsed, 1e-6)
+        print "Loaded {} documents from {} ({:.2f} MB/s, {:.1f} docs/s)".format(
+            count, filepath, stream.bytes_read / elapsed / 2**20,
+            count / elapsed)
 
 
 if __name__ == '__main__':
     from yatiri.log import setup_logging; setup_logging()
     parser = argparse.ArgumentParser()
-    parser.add_argument('files', metavar='datafile', nargs="+")
+    parser.add_argument('files', metavar='datafile', nargs="+",
+                        help="files, directories or globs. `-` for stdin")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="number of parsing processes")
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore previous checkpoints")
+    parser.add_argument('--incremental', action='store_true',
+                        help="skip unchanged documents")
+    parser.add_argument('--format', choices=FORMATS,
+                        help="stdin format")
+    parser.add_argument('--compression', choices=sorted(OPENERS),
+                        help="stdin compression")
     args = parser.parse_args()
+    if STDIN in args.files and not args.format:
+        parser.error("--format is required when reading from stdin")
     main(args)
@@ -37,7 +37,8 @@ def main(args):
             xdoc.add_term('date', date)
             conn.replace(xdoc)
 
-        print "Updated {} documents".format(count)
+    search.bump_generation(settings.XAPIAN_DB)
+    print "Updated {} documents".format(count)
 
 
 if __name__ == '__main__':
@@ -17,6 +17,10 @@ from sklearn.grid_search import GridSearchCV
 from sklearn.utils.extmath import density
 
 from yatiri import datastore
+from yatiri.batch import train
+from yatiri.registry import (
+    ModelRegistry, TrainingFingerprint, training_fingerprint,
+)
 from yatiri.classification import (
     build_model_a,
     build_model_b,
@@ -24,10 +28,16 @@ from yatiri.classification import (
     build_model_d,
     build_model_e,
     build_model_f,
+    build_model_g,
+    build_model_h,
+    build_model_stream,
+    use_stemming,
 )
+from yatiri.gridsearch import CachedGridSearch
 from yatiri.hashing import doc_guid
 from yatiri.keys import next_key, get_key
 from yatiri.timing import WriteRuntime
+from yatiri.tokencache import TokenCache, use_token_cache, drop_token_cache
 
 
 logger = logging.getLogger(__file__)
@@ -40,6 +50,8 @@ MODELS = (
     #('randomforest', build_model_d()),
     #('camel', build_model_e()),
     #('basescaled', build_model_f()),
+    #('randomforestsparse', build_model_g()),
+    #('basescaledsparse', build_model_h()),
 )
 
 # test parameters
@@ -88,7 +100,20 @@ PARAMETERS = {
         'vect__max_df': 0.5,
         'vect__min_df': 3,
         'vect__ngram_range': (1,4),
-    }
+    },
+    'randomforestsparse': {
+        'vect__binary': True,
+        'vect__max_df': .5,
+        'vect__min_df': 1,
+        'vect__ngram_range': (1,4),
+        'select__k': 1000,
+        'clf__n_jobs': 1,
+    },
+    'basescaledsparse': {
+        'vect__max_df': 0.5,
+        'vect__min_df': 3,
+        'vect__ngram_range': (1,4),
+    },
 }
 
 
@@ -111,13 +136,13 @@ GRID_PARAMETERS = {
         'vect__body__max_df': (.5, 1),
         'vect__body__min_df': (1, 3),
         'vect__body__ngram_range': [(1,2), (2,4)],
-        'clf__n_jobs': 4,
+        'clf__n_jobs': (4,),
     },
     'randomforest': {
         'vect__max_df': (.5, 1),
         'vect__min_df': (1, 2),
         'vect__ngram_range': [(1,2), (2,4)],
-        'clf__n_jobs': 4,
+        'clf__n_jobs': (4,),
     },
 }
 
@@ -278,7 +303,59 @@ def load_keys(fromkey, offset, limit):
     it = db.range(fromkey, tokey)
     return [v for k,v in itertools.islice(it, offset, offset + limit)]
 
+def run_streaming(args):
+    if args.import_training:
+        count = train.import_labelled(args.train_path)
+        print "Imported {} documents into the training database".format(count)
+
+    classes = train.get_classes()
+    print "{} categories".format(len(classes))
+
+    model = build_model_stream()
+    if args.stem:
+        use_stemming(model)
+    fingerprint = TrainingFingerprint()
+    batches = train.iter_minibatches(
+        train.iter_fingerprinted(train.iter_labelled(), fingerprint),
+        args.batch_size)
+    with WriteRuntime("train time: {elapsed:.3f}\n", sys.stdout):
+        score = train.train_streaming(model, batches, classes)
+    if score is not None:
+        print "progressive accuracy: {:.3f}".format(score)
+    if args.save_model:
+        version = ModelRegistry().save(
+            args.save_model, model,
+            fingerprint=fingerprint.hexdigest(),
+            metrics={'progressive_accuracy': score})
+        print "Model saved as {}:{}".format(args.save_model, version)
+    return model
+
+
+def save_model(args, name, model, categories, train_data, train_target,
+               test_data, test_target):
+    model.set_params(**PARAMETERS[name])
+    with WriteRuntime("train time: {elapsed:.3f}\n", sys.stdout):
+        model.fit(train_data, train_target)
+    scores = {}
+    if test_data:
+        pred = model.predict(test_data)
+        scores['f1'] = metrics.f1_score(test_target, pred)
+        print "f1-score: {:.3f}".format(scores['f1'])
+    drop_token_cache(model)
+    model.target_names = categories
+    version = ModelRegistry().save(
+        args.save_model, model,
+        fingerprint=training_fingerprint(
+            train_data, [categories[t] for t in train_target]),
+        metrics=scores)
+    print "Model {} saved as {}:{}".format(name, args.save_model, version)
+
+
 def main(args):
+    if args.stream:
+        run_streaming(args)
+        return
+
     dataset = load_docs(args.train_path)
 
     if args.train_size:
@@ -293,14 +370,33 @@ def main(args):
 
     print "{} categories".format(len(categories))
 
+    if args.stem:
+        for name, model in MODELS:
+            use_stemming(model)
+
+    if args.token_cache:
+        cache = TokenCache()
+        with WriteRuntime("token cache time: {elapsed:.3f}\n", sys.stdout):
+            for name, model in MODELS:
+                use_token_cache(model, cache, dataset.data)
+
     if args.best_parameters:
         cv = ShuffleSplit(len(dataset.data), n_iterations=10, test_size=.2)
         for name, model in MODELS:
-            print "GridSearchCV", name
-            grid = GridSearchCV(model, cv=cv,
-                                param_grid=GRID_PARAMETERS[name])
-                                #n_jobs=1, score_func=metrics.auc_score,
-                                #verbose=4)
+            if args.search == 'grid':
+                print "GridSearchCV", name
+                grid = GridSearchCV(model, cv=cv,
+                                    param_grid=GRID_PARAMETERS[name],
+                                    n_jobs=args.n_jobs)
+                                    #score_func=metrics.auc_score,
+                                    #verbose=4)
+            else:
+                print "CachedGridSearch", name
+                grid = CachedGridSearch(model, cv=cv,
+                                        param_grid=GRID_PARAMETERS[name],
+                                        n_jobs=args.n_jobs,
+                                        halving=args.search == 'halving',
+                                        eta=args.eta)
             with WriteRuntime("best parameters time: {elapsed:.3f}\n", sys.stdout):
                 grid.fit(dataset.data, dataset.target)
 
@@ -313,6 +409,13 @@ def main(args):
     train_target, test_target = split_list(dataset.target, train_size)
     print "{} documents (training set)".format(len(train_data))
 
+    if args.save_model:
+        # register first model evaluated on the testing set
+        name, model = MODELS[0]
+        save_model(args, name, model, categories, train_data, train_target,
+                   test_data, test_target)
+        return
+
     if args.classify_keys:
         # override test data from given keys
         data = load_keys(args.classify_keys, args.classify_skip,
@@ -331,6 +434,9 @@ def main(args):
             pred = model.predict(data)
             results.append(pred)
 
+        if args.token_cache:
+            cache.flush()
+
         labels = []
         for i, doc in enumerate(data):
             _by_model = []
@@ -367,6 +473,25 @@ if __name__ == '__main__':
     parser.add_argument('--classify-limit', type=int, default=10)
     parser.add_argument('--classify-skip', type=int, default=0)
     parser.add_argument('--best-parameters', action='store_true')
+    parser.add_argument('--search', choices=('grid', 'cached', 'halving'),
+                        default='cached',
+                        help="--best-parameters search mode: plain grid, "
+                             "reusing fitted vectorizers or successive halving")
+    parser.add_argument('--n-jobs', type=int, default=-1,
+                        help="parallel search jobs, -1 for all cores")
+    parser.add_argument('--eta', type=int, default=3,
+                        help="halving rate between rounds")
     parser.add_argument('--report-short', action='store_true')
+    parser.add_argument('--stem', action='store_true',
+                        help="stem tokens in the vectorizers")
+    parser.add_argument('--token-cache', action='store_true',
+                        help="reuse tokens stored from previous runs")
+    parser.add_argument('--stream', action='store_true',
+                        help="out-of-core training over the training db")
+    parser.add_argument('--import-training', action='store_true',
+                        help="store train_path documents in the training db")
+    parser.add_argument('--batch-size', type=int, default=train.BATCH_SIZE)
+    parser.add_argument('--save-model', metavar='NAME',
+                        help="train and register the model as NAME")
     args = parser.parse_args()
     main(args)
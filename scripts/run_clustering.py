@@ -10,28 +10,29 @@ import pprint
 
 
 from collections import defaultdict
-from nltk.corpus import stopwords as nltk_stopwords
 from nltk.tokenize import wordpunct_tokenize
 from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.feature_extraction.text import (
-    TfidfVectorizer, strip_accents_ascii,
-    TfidfTransformer, CountVectorizer
+    TfidfVectorizer, TfidfTransformer, CountVectorizer
 )
 
 from yatiri import datastore
-from yatiri.batch.load import get_key as get_corpus_key
+from yatiri.analysis import Analyzer
+from yatiri.batch.load import get_key as get_corpus_key, range_fingerprint
+from yatiri.features import get_preprocessor
+from yatiri.matrixstore import matrix_key, load_matrix, save_matrix
+from yatiri.stopwords import STOP_WORDS as _STOP_WORDS
 from yatiri.timing import LogRuntime
 
 
 logger = logging.getLogger(__file__)
 
 
-STOP_WORDS = map(lambda s: s.decode('utf-8'), nltk_stopwords.words('spanish'))
-STOP_WORDS = map(strip_accents_ascii, STOP_WORDS) + [
+STOP_WORDS = _STOP_WORDS | frozenset([
     'cochabamba',
     'la paz',
     'santa cruz',
-]
+])
 
 
 DISCARD_URLS = (
@@ -42,48 +43,53 @@ DISCARD_URLS = (
     '/economia/',
 )
 
-def _get_data(args):
+def get_key_range(args):
     key_from = 'news:{}:'.format(args.date_from.replace('-', ''))
     key_to = 'news:{};'.format(args.date_to.replace('-', ''))
+    return key_from, key_to
+
+
+def _get_data(args):
+    key_from, key_to = get_key_range(args)
     db = datastore.corpus_db()
     for key, doc in db.range(key_from, key_to):
         if not any(uri in doc['url'] for uri in DISCARD_URLS):
-            yield doc
+            yield key, doc
 
 
 def get_data(args):
-    return filter(None, _get_data(args))
-
+    return filter(lambda (k, doc): doc, _get_data(args))
 
-def get_preprocessor(fields):
-    """Build preprocessor"""
-    def preprocessor(doc):
-        """Receives the input from fit() or transform().
-        Returns a string.
-        """
-        values = filter(None, (doc.get(f, '') for f in fields))
-        return '\n'.join(map(clean_text, values))
 
-    return preprocessor
+def get_analyzer():
+    return Analyzer(STOP_WORDS, normalize=False)
 
 
-def clean_text(text):
-    text = text.lower()
-    text = strip_accents_ascii(text.decode('utf-8'))
-    return text
+def get_matrix_params(args):
+    return dict(
+        analyzer=get_analyzer().config,
+        # loads outside the date range keep the matrix
+        contents=range_fingerprint(*get_key_range(args)),
+        date_from=args.date_from,
+        date_to=args.date_to,
+        fields=args.fields,
+        ngram_range=(args.min_ngrams, args.max_ngrams),
+        max_df=args.max_df,
+        max_features=args.max_features,
+        sublinear_tf=args.sublinear_tf,
+        norm=args.norm,
+    )
 
 
-def main(args):
-    logger.debug("Arguments: %r", args)
+def fit_matrix(args):
     tfidf_vect = TfidfVectorizer(
-        preprocessor=get_preprocessor(args.fields),
+        preprocessor=get_preprocessor(*args.fields),
         analyzer='word', # maybe callable
-        token_pattern=r'\b[a-z]\w+\b',
+        tokenizer=get_analyzer(),
         ngram_range=(args.min_ngrams, args.max_ngrams),
         max_df=args.max_df,
         max_features=args.max_features,
         sublinear_tf=args.sublinear_tf,
-        stop_words=STOP_WORDS,
         norm=args.norm,
     )
 
@@ -92,15 +98,39 @@ def main(args):
     if data:
         logger.debug("Corpus size: {0}".format(len(data)))
     else:
-        logger.error("Empty data")
-        return
+        return None
 
+    keys, docs = zip(*data)
     with LogRuntime("Fitted in {0.elapsed} seconds", logger):
-        X = tfidf_vect.fit_transform(data)
+        X = tfidf_vect.fit_transform(docs)
 
-    logger.debug("Vocabulary size: {}".format(len(tfidf_vect.vocabulary_)))
     logger.debug("Max DF stop words size: {}".format(len(tfidf_vect.stop_words_)))
-    logger.debug("Stop words size: {}".format(len(tfidf_vect.stop_words)))
+    logger.debug("Stop words size: {}".format(len(STOP_WORDS)))
+    return X, tfidf_vect.get_feature_names(), keys
+
+
+def main(args):
+    logger.debug("Arguments: %r", args)
+    params = get_matrix_params(args)
+    key = matrix_key(**params)
+
+    stored = None
+    if not args.refit:
+        with LogRuntime("Loaded matrix in {elapsed} seconds", logger):
+            stored = load_matrix(key)
+    if stored:
+        X, feature_names, keys = stored
+    else:
+        fitted = fit_matrix(args)
+        if not fitted:
+            logger.error("Empty data")
+            return
+        X, feature_names, keys = fitted
+        save_matrix(key, X, feature_names, keys, params)
+        logger.debug("Stored matrix {}".format(key))
+
+    feature_names = np.asarray(feature_names)
+    logger.debug("Vocabulary size: {}".format(len(feature_names)))
 
     if args.clusters:
         true_k = args.clusters
@@ -121,27 +151,22 @@ def main(args):
     with LogRuntime("KMeans Fitted in {0.elapsed} seconds", logger):
         km.fit(X)
 
+    n_docs = X.shape[0]
     if args.sample_random and args.sample_size:
-        sample = [
-            data[i] for i in np.random.random_integers(0, len(data), args.sample_size)
-        ]
+        sample = np.random.randint(0, n_docs, args.sample_size)
     elif args.sample_size:
-        sample = data[args.sample_skip:args.sample_size]
+        sample = np.arange(args.sample_skip, min(args.sample_size, n_docs))
     else:
-        sample = data
-
-    Y = tfidf_vect.transform(sample)
-    sample_terms = tfidf_vect.inverse_transform(Y)
+        sample = np.arange(n_docs)
 
+    db = datastore.corpus_db()
+    Y = X[sample]
     labels = km.predict(Y)
     distances = km.transform(Y)
-    center_terms = tfidf_vect.inverse_transform(km.cluster_centers_)
 
     clusters = defaultdict(list)
-    vocabulary = tfidf_vect.vocabulary_
-
-    for i, doc in enumerate(sample):
-        clusters[labels[i]].append((i, doc))
+    for i, label in enumerate(labels):
+        clusters[label].append(i)
 
     truncate = lambda t: t[:100] + '...' if len(t) > 100 else t
 
@@ -149,26 +174,22 @@ def main(args):
         # skip single results
         if len(result) < args.cluster_minsize:
             continue
-        terms_joined = ', '.join(sorted(
-            center_terms[label], reverse=True,
-            key=lambda t: km.cluster_centers_[label, vocabulary[t]]
-        ))
+        center = km.cluster_centers_[label]
+        top = np.argsort(center)[::-1]
+        terms_joined = ', '.join(feature_names[top[center[top] > 0]])
         print '='*79
         print '='*79
         print '='*79
         print '-> ' + truncate(terms_joined) + '\n\n'
-        result = sorted(
-            result,
-            key=lambda (i,_): distances[i,label],
-        )
+        result = sorted(result, key=lambda i: distances[i,label])
 
         j = 0
-        for i, doc in result:
+        for i in result:
             j += 1
-            doc_terms = ', '.join(sorted(
-                sample_terms[i], reverse=True,
-                key=lambda t: Y[i, vocabulary[t]],
-            ))
+            row = Y[i]
+            doc_terms = ', '.join(
+                feature_names[row.indices[np.argsort(row.data)[::-1]]])
+            doc = db[keys[sample[i]]]
             print doc['headline']
             print get_corpus_key(doc)
             print doc['url']
@@ -197,6 +218,8 @@ if __name__ == '__main__':
                         default=['headline', 'teaser', 'body'])
     parser.add_argument('-o', '--output')
     parser.add_argument('--shell', action='store_true')
+    parser.add_argument('--refit', action='store_true',
+                        help="ignore stored feature matrix")
 
     group = parser.add_argument_group('CountVectorizer parameters')
     group.add_argument('--min-ngrams', type=int, default=1)
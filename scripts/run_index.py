@@ -5,6 +5,10 @@ import logging
 
 from yatiri import datastore
 from yatiri.batch import search
+from yatiri.batch.index import (
+    build_index, get_watermark, set_watermark, SHARD_DOCS,
+)
+from yatiri.batch.load import last_change, read_changes
 from yatiri.keys import next_key
 from yatiri.hashing import doc_guid
 from yatiri.utils import report_progress
@@ -29,17 +33,56 @@ def get_classified_items(filepath, db):
             yield key, doc
 
 
+def get_changed_items(since, db, state):
+    seen = set()
+    for seq, key in read_changes(since):
+        state['last'] = seq
+        if key in seen:
+            continue
+        seen.add(key)
+        doc = db.get(key)
+        if doc is None:
+            logger.warning("Changed key without document {!r}".format(key))
+            continue
+        yield key, doc
+
+
 def main(args):
     # index corpus
     db = datastore.corpus_db()
+    # changes up to here are covered by a whole corpus index
+    last = last_change()
+    if args.workers:
+        count = build_index(db, 'corpus', workers=args.workers,
+                            shard_docs=args.shard_docs)
+        set_watermark(last)
+        print "Indexed {} documents".format(count)
+        return
+
+    replace = False
+    state = {}
     if args.prefix:
         items = db.range(args.prefix, next_key(args.prefix))
     elif args.from_classified:
         items = get_classified_items(args.from_classified, db)
+    elif args.changes_since is not None:
+        items = get_changed_items(args.changes_since, db, state)
+        replace = True
+    elif args.incremental:
+        watermark = get_watermark()
+        print "Indexing changes after {}".format(watermark)
+        items = get_changed_items(watermark, db, state)
+        replace = True
     else:
         items = db.range()
-    count = search.index(items, 'corpus', create=args.create)
+        state['last'] = last
+    count = search.index(items, 'corpus', create=args.create,
+                         replace=replace)
     print "Indexed {} documents".format(count)
+    if 'last' in state:
+        print "Last change indexed: {}".format(state['last'])
+        if args.changes_since is None:
+            set_watermark(state['last'])
 
 
 if __name__ == '__main__':
@@ -48,5 +91,16 @@ if __name__ == '__main__':
     parser.add_argument('prefix', nargs='?', help="key prefix")
     parser.add_argument('--create', action='store_true')
     parser.add_argument('--from-classified')
+    parser.add_argument('--changes-since', type=int, metavar='SEQ',
+                        help="index keys from the changes log after SEQ")
+    parser.add_argument('--incremental', action='store_true',
+                        help="index the changes since the last run")
+    parser.add_argument('-w', '--workers', type=int,
+                        help="rebuild the whole index in parallel shards")
+    parser.add_argument('--shard-docs', type=int, default=SHARD_DOCS,
+                        help="documents per shard")
     args = parser.parse_args()
+    if args.workers and (args.prefix or args.from_classified or
+                         args.incremental or args.changes_since is not None):
+        parser.error("--workers rebuilds the whole index")
     main(args)
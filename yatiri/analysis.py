@@ -0,0 +1,50 @@
+from yatiri.stemming import CACHE_SIZE, CachedStemmer
+from yatiri.stopwords import STOP_WORDS
+from yatiri.text import normalize_text
+from yatiri.tokenize import RE_ONLY_WORDS
+
+
+class Analyzer(object):
+    """Text to tokens in a single pass: normalization, lower-casing,
+    tokenization, stop words removal and, optionally, stemming.
+
+    >>> analyze = Analyzer(stop_words=['de'])
+    >>> analyze(u'Marcha de Mineros en 2012')
+    [u'marcha', u'mineros', u'en']
+
+    Instances are picklable, so they can be shipped to worker processes
+    within fitted models.
+    """
+
+    def __init__(self, stop_words=STOP_WORDS, normalize=True, stem=False,
+                 stem_cache_size=CACHE_SIZE):
+        self.stop_words = frozenset(stop_words)
+        self.normalize = normalize
+        self.stemmer = CachedStemmer(stem_cache_size) if stem else None
+
+    def __call__(self, text):
+        if self.normalize:
+            text = normalize_text(text)
+        stop_words = self.stop_words
+        tokens = [
+            token for token in RE_ONLY_WORDS.findall(text.lower())
+            if token not in stop_words
+        ]
+        if self.stemmer:
+            tokens = self.stemmer.stem_many(tokens)
+        return tokens
+
+    @property
+    def config(self):
+        """Settings affecting the output, suitable as cache key."""
+        return (
+            self.__class__.__name__,
+            tuple(sorted(self.stop_words)),
+            self.normalize,
+            bool(self.stemmer),
+        )
+
+    def __repr__(self):
+        return '{}(stop_words=<{} words>, normalize={!r}, stem={!r})'.format(
+            self.__class__.__name__, len(self.stop_words), self.normalize,
+            bool(self.stemmer))
@@ -0,0 +1,38 @@
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+
+class AsyncDB(object):
+    """Deferred interface to a LevelDB database.
+
+    Reads run in a dedicated thread pool (leveldb releases the GIL while
+    reading), so a slow disk read doesn't stall the reactor.
+    """
+
+    def __init__(self, db, minthreads=2, maxthreads=8, name='asyncdb'):
+        self.db = db
+        self.threadpool = ThreadPool(minthreads, maxthreads, name=name)
+
+    def start(self):
+        self.threadpool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', self.stop)
+
+    def stop(self):
+        if self.threadpool.started:
+            self.threadpool.stop()
+
+    def _run(self, func, *args):
+        return deferToThreadPool(reactor, self.threadpool, func, *args)
+
+    def get(self, key):
+        return self._run(self.db.get, key)
+
+    def multi_get(self, keys):
+        """Fetches given keys in a single thread pool call. Returns a list
+        with the values, or None, in the same order."""
+        return self._run(self._multi_get, list(keys))
+
+    def _multi_get(self, keys):
+        get = self.db.get
+        return [get(key) for key in keys]
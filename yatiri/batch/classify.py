@@ -0,0 +1,106 @@
+import itertools
+import logging
+import multiprocessing
+
+from yatiri import datastore
+from yatiri.batch.load import imap_bounded
+from yatiri.keys import next_key
+from yatiri.registry import ModelRegistry
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# model loaded once per worker process
+_model = None
+
+
+def _init_worker(model):
+    global _model
+    if isinstance(model, basestring):
+        # memory-mapped arrays are shared by all the workers
+        model = ModelRegistry().load_spec(model)
+    _model = model
+
+
+def get_labels(model, docs):
+    """Returns a label entry per document with the predicted ``category``
+    and the per-category ``proba``, or ``scores`` for classifiers that
+    can't estimate probabilities."""
+    # transform once for both predictions
+    X = docs
+    for name, step in model.steps[:-1]:
+        X = step.transform(X)
+    clf = model.steps[-1][1]
+
+    classes = clf.classes_.tolist()
+    names = getattr(model, 'target_names', None)
+    if names:
+        classes = [names[c] for c in classes]
+
+    predicted = clf.predict(X).tolist()
+    try:
+        weights, field = clf.predict_proba(X), 'proba'
+    except (AttributeError, NotImplementedError):
+        weights, field = clf.decision_function(X), 'scores'
+
+    labels = []
+    for target, row in zip(predicted, weights.tolist()):
+        if not isinstance(row, list):
+            # binary decision function, score of the positive class
+            row = [-row, row]
+        labels.append({
+            'category': names[target] if names else target,
+            field: dict(zip(classes, row)),
+        })
+    return labels
+
+
+def _classify_batch(batch):
+    # runs in the worker processes
+    keys, docs = batch
+    return zip(keys, get_labels(_model, docs))
+
+
+def iter_batches(items, size=BATCH_SIZE):
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            break
+        yield zip(*batch)
+
+
+def classify(model, prefix='news:', workers=1, batch_size=BATCH_SIZE):
+    """Classifies the corpus documents under ``prefix`` storing the
+    predictions in the labels database.
+
+    ``model`` is a fitted pipeline or a ``name[:version]`` reference to
+    a registered one. The current process reads the corpus and writes the
+    labels while ``workers`` processes run the predictions.
+    """
+    items = datastore.corpus_db().range(prefix, next_key(prefix))
+    batches = iter_batches(items, batch_size)
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _init_worker, (model,))
+        results = imap_bounded(pool, _classify_batch, batches, 2 * workers)
+    else:
+        pool = None
+        _init_worker(model)
+        results = itertools.imap(_classify_batch, batches)
+
+    db = datastore.labels_db()
+    n = 0
+    try:
+        for labels in results:
+            with db.write_batch() as wb:
+                for key, label in labels:
+                    wb[key] = label
+            n += len(labels)
+            logger.debug("Classified {} documents".format(n))
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    return n
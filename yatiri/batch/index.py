@@ -1,2 +1,126 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import xapian
 
+from yatiri import datastore, settings
+from yatiri.batch.load import imap_bounded
+from yatiri.batch.search import index, get_generation, GENERATION_FILE
+from yatiri.timing import Timer
 
+
+logger = logging.getLogger(__name__)
+
+
+# documents per shard
+SHARD_DOCS = 10000
+
+# last changes log entry indexed
+WATERMARK_KEY = 'index:watermark'
+
+
+def get_watermark():
+    return datastore.state_db().get(WATERMARK_KEY) or 0
+
+
+def set_watermark(seq):
+    datastore.state_db()[WATERMARK_KEY] = seq
+
+
+def iter_shards(items, shard_docs=SHARD_DOCS):
+    """Yields lists of up to ``shard_docs`` consecutive ``(key, doc)``
+    items.
+
+    >>> [len(shard) for shard in iter_shards(range(25), 10)]
+    [10, 10, 5]
+
+    """
+    items = iter(items)
+    while True:
+        shard = list(itertools.islice(items, shard_docs))
+        if not shard:
+            break
+        yield shard
+
+
+def _index_shard(args):
+    path, doc_type, items = args
+    timer = Timer()
+    with timer:
+        count = index(items, doc_type, create=True, dbpath=path, bump=False)
+    return path, count, timer.elapsed
+
+
+def compact(sources, dest):
+    """Merges the databases ``sources`` into a new compacted ``dest``."""
+    if hasattr(xapian.Database, 'compact'):
+        db = xapian.Database()
+        for path in sources:
+            db.add_database(xapian.Database(path))
+        db.compact(dest)
+    else:
+        subprocess.check_call(['xapian-compact'] + list(sources) + [dest])
+
+
+def build_index(db, doc_type, workers=None, shard_docs=SHARD_DOCS,
+                dbpath=None):
+    """Rebuilds the index splitting the whole corpus in shards indexed in
+    parallel, merged at the end into ``dbpath``.
+
+    Only this process reads ``db``, workers get the shard documents.
+    """
+    dbpath = dbpath or settings.XAPIAN_DB
+    shards_root = dbpath + '.shards'
+    if os.path.exists(shards_root):
+        shutil.rmtree(shards_root)
+    os.makedirs(shards_root)
+
+    workers = workers or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers)
+    tasks = (
+        (os.path.join(shards_root, '{:05d}'.format(n)), doc_type, items)
+        for n, items in enumerate(iter_shards(db.range(), shard_docs))
+    )
+    shards = []
+    total = 0
+    try:
+        for path, count, elapsed in imap_bounded(pool, _index_shard, tasks,
+                                                 workers):
+            logger.info("Shard {}: {} documents ({:.1f} docs/s)".format(
+                os.path.basename(path), count, count / max(elapsed, 1e-6)))
+            if count:
+                shards.append(path)
+                total += count
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    if not shards:
+        shutil.rmtree(shards_root)
+        return 0
+
+    # swap the merged index in place of the current one
+    newpath = dbpath + '.new'
+    if os.path.exists(newpath):
+        shutil.rmtree(newpath)
+    logger.info("Compacting {} shards".format(len(shards)))
+    compact(shards, newpath)
+    with open(os.path.join(newpath, GENERATION_FILE), 'w') as fp:
+        fp.write(str(get_generation(dbpath) + 1))
+    if os.path.exists(dbpath):
+        oldpath = dbpath + '.old'
+        if os.path.exists(oldpath):
+            shutil.rmtree(oldpath)
+        os.rename(dbpath, oldpath)
+        os.rename(newpath, dbpath)
+        shutil.rmtree(oldpath)
+    else:
+        os.rename(newpath, dbpath)
+    shutil.rmtree(shards_root)
+    return total
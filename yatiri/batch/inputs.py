@@ -0,0 +1,171 @@
+import bz2
+import glob
+import gzip
+import hashlib
+import os
+import sys
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+STDIN = '-'
+
+READ_SIZE = 256 * 1024
+
+# leading bytes hashed into the file signature
+SIGNATURE_BYTES = 64 * 1024
+
+FORMATS = (
+    'csv',
+    'jl',
+)
+
+
+def _require_lzma():
+    if lzma is None:
+        raise ValueError("xz input requires backports.lzma")
+    return lzma
+
+
+OPENERS = {
+    'gz': lambda path: gzip.open(path, 'rb'),
+    'bz2': lambda path: bz2.BZ2File(path, 'rb'),
+    'xz': lambda path: _require_lzma().LZMAFile(path, 'rb'),
+}
+
+DECOMPRESSORS = {
+    'gz': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+    'bz2': lambda: bz2.BZ2Decompressor(),
+    'xz': lambda: _require_lzma().LZMADecompressor(),
+}
+
+
+def detect_format(path):
+    """Returns ``(format, compression)`` from file extensions.
+
+    >>> detect_format('data/2012.jl')
+    ('jl', None)
+    >>> detect_format('data/2012.csv.gz')
+    ('csv', 'gz')
+    >>> detect_format('data/README')
+    (None, None)
+
+    """
+    root, ext = os.path.splitext(path)
+    compression = ext[1:] if ext[1:] in OPENERS else None
+    if compression:
+        root, ext = os.path.splitext(root)
+    fmt = ext[1:] if ext[1:] in FORMATS else None
+    return fmt, compression
+
+
+def expand_paths(paths):
+    """Yields input files from given paths, globs and directories.
+    ``-`` stands for the standard input."""
+    for path in paths:
+        if path == STDIN:
+            yield path
+            continue
+        for match in sorted(glob.glob(path)) or [path]:
+            if os.path.isdir(match):
+                for root, dirs, files in os.walk(match):
+                    dirs.sort()
+                    for name in sorted(files):
+                        yield os.path.join(root, name)
+            else:
+                yield match
+
+
+def file_signature(path):
+    """Returns the ``size:mtime:digest`` of the file, where digest hashes
+    its first block. A regenerated or grown file gets a new signature."""
+    st = os.stat(path)
+    with open(path, 'rb') as fp:
+        digest = hashlib.sha1(fp.read(SIGNATURE_BYTES)).hexdigest()[:16]
+    return '{}:{}:{}'.format(st.st_size, int(st.st_mtime), digest)
+
+
+def iter_decompressed(fp, compression):
+    """Yields decompressed lines from a non-seekable stream."""
+    decompressor = DECOMPRESSORS[compression]()
+    tail = ''
+    while True:
+        data = fp.read(READ_SIZE)
+        if not data:
+            break
+        try:
+            chunk = decompressor.decompress(data)
+        except EOFError:
+            # bz2 stream ended right at the previous read
+            decompressor = DECOMPRESSORS[compression]()
+            chunk = decompressor.decompress(data)
+        # concatenated streams (i.e. multi-member gzip)
+        while getattr(decompressor, 'unused_data', ''):
+            data = decompressor.unused_data
+            decompressor = DECOMPRESSORS[compression]()
+            chunk += decompressor.decompress(data)
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if tail:
+        yield tail
+
+
+class InputStream(object):
+    """Lines iterator over a, possibly compressed, input keeping track of
+    the bytes read."""
+
+    def __init__(self, name, fp, lines=None):
+        self.name = name
+        self.fp = fp
+        self.lines = iter(fp) if lines is None else lines
+        self.bytes_read = 0
+
+    @property
+    def seekable(self):
+        return self.name != STDIN
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.lines.next()
+        self.bytes_read += len(line)
+        return line
+
+    def seek(self, offset):
+        if not self.seekable:
+            raise IOError("Can not seek {}".format(self.name))
+        self.fp.seek(offset)
+
+    def close(self):
+        if self.fp is not sys.stdin:
+            self.fp.close()
+
+    # context protocol
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_input(path, compression=None):
+    """Opens given path, or stdin, decompressing it on the fly."""
+    if path == STDIN:
+        if compression:
+            lines = iter_decompressed(sys.stdin, compression)
+        else:
+            lines = None
+        return InputStream(path, sys.stdin, lines)
+    if compression:
+        return InputStream(path, OPENERS[compression](path))
+    return InputStream(path, open(path, 'rb'))
@@ -1,9 +1,13 @@
+import collections
 import csv
+import hashlib
+import itertools
 import json
 import logging
+import multiprocessing
 
 from yatiri import datastore
-from yatiri.hashing import doc_guid
+from yatiri.hashing import doc_fingerprint, doc_guid
 from yatiri.keys import get_key
 
 
@@ -18,6 +22,13 @@ REQUIRED_FIELDS = (
     'url',
 )
 
+# limits per write batch and per worker task
+BATCH_DOCS = 1000
+BATCH_BYTES = 16 * 1024 * 1024
+
+CHECKPOINT_KEY = 'load:{}'
+CHANGE_KEY = '{:016d}'
+
 
 def parse_domain(url):
     """Returns domain from URL.
@@ -52,32 +63,269 @@ def preprocess(doc):
     return doc
 
 
-def load_csv(stream):
+def encode_doc(doc):
+    """Returns ``(key, value, fingerprint)`` ready to be written to the
+    corpus."""
+    doc = preprocess(doc)
+    key = get_key(doc)
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return key, datastore.encoder.encode(doc), doc_fingerprint(doc)
+
+
+def parse_csv_row(row):
+    return dict((k, v.decode('utf-8')) for k, v in row.iteritems())
+
+
+def parse_jsonline(line):
+    return json.loads(line)
+
+
+class OffsetLines(object):
+    """Lines iterator keeping track of the consumed bytes of ``stream``.
+
+    Seeking to the offset of a line boundary resumes at the next line:
+
+    >>> from StringIO import StringIO
+    >>> lines = OffsetLines(StringIO('{"a": 1}\\n{"a": 2}\\n'))
+    >>> lines.next()
+    '{"a": 1}\\n'
+    >>> offset = lines.offset
+    >>> lines = OffsetLines(StringIO('{"a": 1}\\n{"a": 2}\\n'))
+    >>> lines.seek(offset)
+    >>> list(lines), lines.offset
+    (['{"a": 2}\\n'], 18)
+
+    """
+
+    def __init__(self, stream, offset=0):
+        self.stream = stream
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.stream.next()
+        self.offset += len(line)
+        return line
+
+    def seek(self, offset):
+        self.stream.seek(offset)
+        self.offset = offset
+
+
+def iter_batches(records, start=0, max_docs=BATCH_DOCS, max_bytes=BATCH_BYTES):
+    """Groups ``(offset, record)`` pairs into ``(offset, records)`` batches
+    bounded by number of records and consumed input bytes.
+
+    >>> records = [(3, 'abc'), (5, 'de'), (11, 'fghijk')]
+    >>> list(iter_batches(records, max_docs=2))
+    [(5, ['abc', 'de']), (11, ['fghijk'])]
+    >>> list(iter_batches(records, max_bytes=4))
+    [(5, ['abc', 'de']), (11, ['fghijk'])]
+
+    """
+    batch = []
+    for offset, record in records:
+        batch.append(record)
+        if len(batch) >= max_docs or offset - start >= max_bytes:
+            yield offset, batch
+            batch = []
+            start = offset
+    if batch:
+        yield offset, batch
+
+
+def _encode_batch(args):
+    # runs in the worker processes
+    parse, offset, records = args
+    return offset, [encode_doc(parse(record)) for record in records]
+
+
+def imap_bounded(pool, func, it, maxpending):
+    """Ordered ``pool.imap`` that doesn't consume ``it`` ahead of
+    ``maxpending`` tasks, keeping memory bounded for large inputs."""
+    pending = collections.deque()
+    for args in it:
+        pending.append(pool.apply_async(func, (args,)))
+        if len(pending) >= maxpending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def resume_state(state, signature=None):
+    """Returns the ``(offset, count)`` to resume from checkpoint ``state``.
+    Checkpoints of another version of the input are ignored.
+
+    >>> state = {'offset': 9, 'count': 1, 'signature': '18:1354233600:ab'}
+    >>> resume_state(state, '18:1354233600:ab')
+    (9, 1)
+    >>> resume_state(state, '27:1354320000:ab')
+    (0, 0)
+    >>> resume_state(None, '18:1354233600:ab')
+    (0, 0)
+
+    """
+    if not state or state.get('signature') != signature:
+        return 0, 0
+    return state['offset'], state['count']
+
+
+def get_checkpoint(name, signature=None):
+    """Returns last committed ``offset`` and ``count`` for given input."""
+    state = datastore.state_db().get(CHECKPOINT_KEY.format(name))
+    return resume_state(state, signature)
+
+
+def set_checkpoint(name, offset, count, signature=None):
+    datastore.state_db()[CHECKPOINT_KEY.format(name)] = {
+        'offset': offset,
+        'count': count,
+        'signature': signature,
+    }
+
+
+def clear_checkpoint(name):
+    db = datastore.state_db()
+    key = CHECKPOINT_KEY.format(name)
+    if key in db:
+        del db[key]
+
+
+def last_change():
+    """Returns sequence number of the last entry in the changes log."""
+    db = datastore.changes_db()
+    for key in db.range(include_value=False, reverse=True):
+        return int(key)
+    return 0
+
+
+def range_fingerprint(key_from, key_to):
+    """Returns a digest of the keys and document fingerprints between
+    ``key_from`` and ``key_to``, which changes with any load touching
+    that range only."""
+    h = hashlib.sha1()
+    for key, fingerprint in datastore.fingerprint_db().range(key_from,
+                                                             key_to):
+        h.update(key)
+        h.update(fingerprint)
+    return h.hexdigest()
+
+
+def append_changes(seq, keys):
+    """Appends ``keys`` to the changes log after ``seq``. Returns the new
+    last sequence number."""
+    with datastore.changes_db().write_batch() as wb:
+        for key in keys:
+            seq += 1
+            wb[CHANGE_KEY.format(seq)] = key
+    return seq
+
+
+def read_changes(since=0):
+    """Yields ``(seq, key)`` entries of the changes log after ``since``."""
+    db = datastore.changes_db()
+    for seq, key in db.range(CHANGE_KEY.format(since + 1)):
+        yield int(seq), key
+
+
+def load_records(records, parse, workers=1, checkpoint=None, start=0,
+                 count=0, progress=None, incremental=False, signature=None):
+    """Parses, preprocesses and stores ``(offset, record)`` pairs in the
+    corpus.
+
+    Documents are committed in bounded batches. If ``checkpoint`` is
+    given, the input offset and total ``count`` are recorded after each
+    commit, along with the input ``signature``, so an interrupted load
+    can be resumed. The checkpoint is cleared once the load completes.
+
+    Every written key is appended to the changes log. In ``incremental``
+    mode documents whose fingerprint matches the stored one are skipped.
+
+    With ``workers > 1`` the CPU work is spread over a pool of processes
+    while the current process remains the only writer.
+    """
+    if progress:
+        records = progress(records)
+    db = datastore.corpus_db()
+    batches = (
+        (parse, offset, batch)
+        for offset, batch in iter_batches(records, start)
+    )
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        results = imap_bounded(pool, _encode_batch, batches, 2 * workers)
+    else:
+        pool = None
+        results = itertools.imap(_encode_batch, batches)
+
+    fingerprints = datastore.fingerprint_db()
+    seq = last_change()
+    n = skipped = 0
+    try:
+        for offset, encoded in results:
+            if incremental:
+                changed = [
+                    item for item in encoded
+                    if fingerprints.get(item[0]) != item[2]
+                ]
+                skipped += len(encoded) - len(changed)
+                encoded = changed
+            datastore.write_encoded(db, (item[:2] for item in encoded))
+            with fingerprints.write_batch() as wb:
+                for key, _, fingerprint in encoded:
+                    wb[key] = fingerprint
+            seq = append_changes(seq, (item[0] for item in encoded))
+            n += len(encoded)
+            if checkpoint:
+                set_checkpoint(checkpoint, offset, count + n, signature)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    if checkpoint:
+        clear_checkpoint(checkpoint)
+    if skipped:
+        logger.info("Skipped {} unchanged documents".format(skipped))
+    return n
+
+
+def _resume(lines, checkpoint, signature=None):
+    if not checkpoint:
+        return 0
+    offset, count = get_checkpoint(checkpoint, signature)
+    if offset > lines.offset:
+        logger.info("Resuming {} from offset {} ({} documents)".format(
+            checkpoint, offset, count))
+        lines.seek(offset)
+    return count
+
+
+def load_csv(stream, workers=1, checkpoint=None, progress=None,
+             incremental=False, signature=None):
+    lines = OffsetLines(stream)
     # read first row as fields
-    fields = csv.reader(stream).next()
+    fields = csv.reader(lines).next()
     if any(f not in fields for f in REQUIRED_FIELDS):
         raise ValueError(
             "Required fields: {}".format(','.join(REQUIRED_FIELDS))
         )
-    reader = csv.DictReader(stream, fields)
-    # do batch write
-    db = datastore.corpus_db()
-    with db.write_batch() as wb:
-        for n, doc in enumerate(reader, 1):
-            doc = preprocess(dict(
-                (k, v.decode('utf-8')) for k, v in doc.iteritems()
-            ))
-            key = get_key(doc)
-            wb[key] = doc
-        return n
-
-
-def load_jsonlines(stream):
-    # do batch write
-    db = datastore.corpus_db()
-    with db.write_batch() as wb:
-        for n, line in enumerate(stream, 1):
-            doc = preprocess(json.loads(line))
-            key = get_key(doc)
-            wb[key] = doc
-        return n
+    count = _resume(lines, checkpoint, signature)
+    start = lines.offset
+    records = (
+        (lines.offset, row) for row in csv.DictReader(lines, fields)
+    )
+    return load_records(records, parse_csv_row, workers, checkpoint, start,
+                        count, progress, incremental, signature)
+
+
+def load_jsonlines(stream, workers=1, checkpoint=None, progress=None,
+                   incremental=False, signature=None):
+    lines = OffsetLines(stream)
+    count = _resume(lines, checkpoint, signature)
+    start = lines.offset
+    records = ((lines.offset, line) for line in lines)
+    return load_records(records, parse_jsonline, workers, checkpoint, start,
+                        count, progress, incremental, signature)
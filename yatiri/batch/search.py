@@ -1,9 +1,14 @@
+import json
+import os
+import weakref
 import xapian
 import xappy
 from xappy import FieldActions
 
 from yatiri import settings
+from yatiri.cursors import decode_cursor, encode_cursor, next_position
 from yatiri.text import normalize_text
+from yatiri.utils import doc_summary
 
 
 # fix missing attribute
@@ -12,6 +17,9 @@ xapian.MultiValueCountMatchSpy = xapian.ValueCountMatchSpy
 
 MAX_MEM = 512 * 1024 * 1024 # in bytes
 
+# bumped on every index update
+GENERATION_FILE = 'generation'
+
 TEXT_DEFAULTS = {
     'language': 'es',
     'nopos': True,
@@ -49,6 +57,21 @@ FACET_FIELDS = (
 #    'topics',
 )
 
+# sortable fields also indexed as exact terms, allowing value cursors
+CURSOR_FIELDS = (
+    'date',
+)
+
+# stored field with the data needed to render a search result
+DISPLAY_FIELD = 'display'
+
+DISPLAY_FIELDS = (
+    'headline',
+    'url',
+    'site',
+    'datetime',
+)
+
 COLLAPSE_FIELDS = (
     'severity',
     'coef1',
@@ -91,10 +114,85 @@ def create_index(conn):
     for name in COLLAPSE_FIELDS:
         conn.add_field_action(name, FieldActions.COLLAPSE)
 
+    conn.add_field_action(DISPLAY_FIELD, FieldActions.STORE_CONTENT)
+
+
+def display_data(data):
+    """Returns the JSON encoded fields to render the document in search
+    results, so the frontend doesn't need to read the corpus."""
+    display = dict((f, data.get(f) or '') for f in DISPLAY_FIELDS)
+    display['images'] = (data.get('images') or [])[:1]
+    display['summary'] = doc_summary(data)
+    return json.dumps(display)
+
+
+
+def get_generation(dbpath=None):
+    """Returns the number of updates done to the index."""
+    path = os.path.join(dbpath or settings.XAPIAN_DB, GENERATION_FILE)
+    try:
+        with open(path) as fp:
+            return int(fp.read().strip() or 0)
+    except IOError:
+        return 0
+
+
+def bump_generation(dbpath=None):
+    dbpath = dbpath or settings.XAPIAN_DB
+    generation = get_generation(dbpath) + 1
+    path = os.path.join(dbpath, GENERATION_FILE)
+    with open(path + '.tmp', 'w') as fp:
+        fp.write(str(generation))
+    os.rename(path + '.tmp', path)
+    return generation
+
 
+# index generation each search connection was last reopened at
+_opened_generation = weakref.WeakKeyDictionary()
 
-def index(items, doc_type, create=False):
-    indexer = IndexerContext(settings.XAPIAN_DB)
+
+def run_current(sconn, generation, func, *args, **kwargs):
+    """Calls ``func(sconn, ...)`` after reopening ``sconn`` if it wasn't
+    reopened since index ``generation``, so it sees the latest revision."""
+    if _opened_generation.get(sconn) != generation:
+        sconn.reopen()
+        _opened_generation[sconn] = generation
+    return func(sconn, *args, **kwargs)
+
+
+def doc_date(data):
+    """Returns the ``YYYY-MM-DD`` day of the document, if any.
+
+    >>> doc_date({'datetime': '2012-11-25 10:30:00'})
+    '2012-11-25'
+    >>> doc_date({'date': 'nov 25'}) is None
+    True
+
+    """
+    val = data.get('date') or data.get('datetime') or ''
+    val = val.partition(' ')[0]
+    if val.count('-') == 2:
+        return val
+
+
+def indexed_categories(conn, key):
+    """Returns the category terms of the indexed document ``key``."""
+    try:
+        return list(conn.get_document(key).get_terms('category'))
+    except KeyError:
+        return []
+
+
+def index(items, doc_type, create=False, replace=False, dbpath=None,
+          bump=True):
+    """Indexes ``(key, doc)`` items in ``dbpath``. The index generation is
+    bumped unless ``bump`` is false, as for shards merged later.
+
+    Replaced documents keep their indexed categories, as these are added
+    afterwards by ``load_categories.py``.
+    """
+    dbpath = dbpath or settings.XAPIAN_DB
+    indexer = IndexerContext(dbpath)
     if create:
         with indexer as conn:
             create_index(conn)
@@ -102,6 +200,9 @@ def index(items, doc_type, create=False):
     preprocess_text = lambda t: normalize_text(t).lower()
 
     with indexer as conn:
+        # indexes created before the display field
+        if DISPLAY_FIELD not in conn.get_fields_with_actions():
+            conn.add_field_action(DISPLAY_FIELD, FieldActions.STORE_CONTENT)
         n = 0
         for n, (key, data) in enumerate(items, 1):
             doc = xappy.UnprocessedDocument(key)
@@ -110,17 +211,17 @@ def index(items, doc_type, create=False):
                 val = data.get(field, '')
                 if val:
                     doc.append(field, preprocess_text(val))
+            date = doc_date(data)
             for field in EXACT_FIELDS:
-                val = data.get(field, '')
-                if field == 'date' and val:
-                    val = val.partition(' ')[0]
-                    if not val.count('-') == 2:
-                        val = None
+                val = date if field == 'date' else data.get(field, '')
                 if val:
                     doc.append(field, val)
+            if replace and not data.get('category'):
+                for category in indexed_categories(conn, key):
+                    doc.append('category', category)
 
             for field, kwargs in SORTABLE_FIELDS:
-                val = data.get(field)
+                val = date if field == 'date' else data.get(field)
                 if not val:
                     continue
                 doc.append(field, val, **kwargs)
@@ -137,8 +238,16 @@ def index(items, doc_type, create=False):
                     continue
                 doc.append(field, val)
 
-            conn.add(doc)
-        return n
+            doc.append(DISPLAY_FIELD, display_data(data))
+
+            if replace:
+                conn.replace(doc)
+            else:
+                conn.add(doc)
+
+    if n and bump:
+        bump_generation(dbpath)
+    return n
 
 
 def execute_query(sconn, q, offset, limit, **kwargs):
@@ -148,3 +257,106 @@ def execute_query(sconn, q, offset, limit, **kwargs):
 
 # legacy alias
 query = execute_query
+
+
+def build_query(sconn, q='', categories=(), date=None):
+    """Returns the query for given text, filtered by any of the categories
+    and by date."""
+    if q:
+        query = sconn.query_parse(q)
+    else:
+        query = sconn.query_all()
+
+    if categories:
+        qc = sconn.query_composite(
+            sconn.OP_OR, [
+                sconn.query_field('category', value)
+                for value in categories
+            ])
+        query = query.filter(qc)
+
+    if date:
+        query = query.filter(sconn.query_field('date', date))
+
+    return query
+
+
+def format_results(results, fields=()):
+    """Returns the results data including given stored fields."""
+    docs = []
+    for r in results:
+        doc = dict(id=r.id, category=next(r.get_terms('category'), None))
+        for field in fields:
+            values = r.data.get(field)
+            if not values:
+                continue
+            if field == DISPLAY_FIELD:
+                doc[field] = json.loads(values[0])
+            else:
+                doc[field] = values[0]
+        docs.append(doc)
+    return {
+        'total': results.matches_estimated,
+        'is_exact': results.estimate_is_exact,
+        'docs': docs,
+    }
+
+
+def cursor_value(result, field):
+    """Returns the ``field`` term of the result, or None if the document
+    has no sort value for it, as in indexes built before it was sortable,
+    since a range filter on the value would skip the document."""
+    try:
+        if not result.get_value(field, 'collsort'):
+            return None
+    except KeyError:
+        return None
+    return next(result.get_terms(field), None)
+
+
+def run_search(sconn, q='', categories=(), date=None, offset=0, limit=10,
+               sortby=None, fields=(), cursor=None):
+    """Runs the search as the search service does and returns its
+    response data.
+
+    When there may be more results, the data includes the ``cursor`` of
+    the next page. Sorted by one of ``CURSOR_FIELDS``, the cursor filters
+    by the last value seen, so deep pages cost the same as the first one.
+    Otherwise it holds the next offset.
+    """
+    query = build_query(sconn, q, categories, date)
+
+    field = sortby.lstrip('+-') if sortby else None
+    by_value = field in CURSOR_FIELDS
+    state = decode_cursor(cursor) if cursor else {}
+    value = state.get('value')
+    if by_value and value is not None:
+        if sortby.startswith('-'):
+            qr = sconn.query_range(field, None, value)
+        else:
+            qr = sconn.query_range(field, value, None)
+        query = query.filter(qr)
+        offset = state.get('seen', 0)
+    elif 'offset' in state:
+        offset = state['offset']
+
+    results = execute_query(sconn, query, offset, limit,
+                            sortby=[sortby] if sortby else None)
+    data = format_results(results, fields)
+
+    if limit and len(data['docs']) == limit:
+        values = None
+        # values seen before an offset page are unknown
+        if by_value and (value is not None or not offset):
+            values = [cursor_value(r, field) for r in results]
+        if values and None not in values:
+            last, seen = next_position(values, value, offset)
+            data['cursor'] = encode_cursor(value=last, seen=seen)
+        else:
+            data['cursor'] = encode_cursor(offset=offset + limit)
+    return data
+
+
+def run_searches(sconn, queries):
+    """Runs several ``run_search`` arguments on the same connection."""
+    return [run_search(sconn, **kwargs) for kwargs in queries]
@@ -0,0 +1,114 @@
+import itertools
+import json
+import logging
+import os
+
+from yatiri import datastore
+from yatiri.batch.load import BATCH_DOCS
+from yatiri.keys import get_key
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+def _iter_labelled_files(path):
+    for category in sorted(os.listdir(path)):
+        catpath = os.path.join(path, category)
+        if not os.path.isdir(catpath):
+            continue
+        for name in os.listdir(catpath):
+            with open(os.path.join(catpath, name), 'rb') as fp:
+                doc = json.load(fp)
+            doc['category'] = category
+            yield get_key(doc), doc
+
+
+def import_labelled(path):
+    """Stores labelled documents from ``path`` in the training database.
+
+    ``path`` contains a directory per category holding JSON documents,
+    as expected by ``sklearn.datasets.load_files``. Documents are
+    committed every ``BATCH_DOCS``.
+    """
+    db = datastore.training_db()
+    items = _iter_labelled_files(path)
+    n = 0
+    while True:
+        batch = list(itertools.islice(items, BATCH_DOCS))
+        if not batch:
+            break
+        with db.write_batch() as wb:
+            for key, doc in batch:
+                wb[key] = doc
+        n += len(batch)
+    return n
+
+
+def iter_labelled():
+    """Yields ``(doc, category)`` pairs from the training database.
+
+    Entries holding only the ``category`` are completed from the corpus.
+    """
+    corpus = datastore.corpus_db()
+    for key, value in datastore.training_db().range():
+        category = value.get('category')
+        if not category:
+            continue
+        if 'body' not in value:
+            value = corpus.get(key)
+            if not value:
+                logger.warning("Training key without document {!r}".format(key))
+                continue
+        yield value, category
+
+
+def iter_fingerprinted(labelled, fingerprint):
+    """Passes through ``(doc, category)`` pairs updating ``fingerprint``
+    with each one."""
+    for doc, category in labelled:
+        fingerprint.update(doc, category)
+        yield doc, category
+
+
+def iter_minibatches(labelled, size=BATCH_SIZE):
+    """Yields ``(docs, targets)`` lists of up to ``size`` items."""
+    labelled = iter(labelled)
+    while True:
+        batch = list(itertools.islice(labelled, size))
+        if not batch:
+            break
+        docs, targets = zip(*batch)
+        yield list(docs), list(targets)
+
+
+def get_classes():
+    """Returns the categories present in the training database. Requires
+    a full pass over it."""
+    return sorted(set(category for _, category in iter_labelled()))
+
+
+def partial_fit(model, docs, targets, classes):
+    """Updates a ``vect``/``clf`` pipeline with a stateless vectorizer."""
+    X = model.named_steps['vect'].transform(docs)
+    model.named_steps['clf'].partial_fit(X, targets, classes=classes)
+    return model
+
+
+def train_streaming(model, batches, classes):
+    """Trains ``model`` over the mini-batches, scoring each one before
+    learning from it (progressive validation).
+
+    Returns the mean accuracy over the scored batches.
+    """
+    scores = []
+    for n, (docs, targets) in enumerate(batches, 1):
+        if n > 1:
+            score = model.score(docs, targets)
+            scores.append(score)
+            logger.info("Batch {}: {} docs, accuracy {:.3f}".format(
+                n, len(docs), score))
+        partial_fit(model, docs, targets, classes)
+    if scores:
+        return sum(scores) / len(scores)
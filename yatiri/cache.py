@@ -0,0 +1,138 @@
+import collections
+import functools
+import time
+
+
+_missing = object()
+
+
+class LRUCache(object):
+    """Bounded mapping discarding the least recently used entries.
+
+    >>> cache = LRUCache(2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3
+    >>> cache.get('b') is None
+    True
+    >>> sorted(cache.keys())
+    ['a', 'c']
+    >>> cache.hit_rate
+    0.5
+
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        return self._data.keys()
+
+    def clear(self):
+        self._data.clear()
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+    def stats(self):
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+
+
+class TTLCache(LRUCache):
+    """LRU cache whose entries expire ``ttl`` seconds after being set.
+
+    >>> now = [0]
+    >>> cache = TTLCache(10, ttl=60, timer=lambda: now[0])
+    >>> cache['a'] = 1
+    >>> cache.get('a')
+    1
+    >>> now[0] = 61
+    >>> cache.get('a') is None
+    True
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, timer=time.time):
+        super(TTLCache, self).__init__(maxsize)
+        self.ttl = ttl
+        self.timer = timer
+
+    def get(self, key, default=None):
+        item = super(TTLCache, self).get(key, _missing)
+        if item is _missing:
+            return default
+        expires, value = item
+        if expires < self.timer():
+            del self[key]
+            self.hits -= 1
+            self.misses += 1
+            return default
+        return value
+
+    def __setitem__(self, key, value):
+        item = (self.timer() + self.ttl, value)
+        super(TTLCache, self).__setitem__(key, item)
+
+    def stats(self):
+        stats = super(TTLCache, self).stats()
+        stats['ttl'] = self.ttl
+        return stats
+
+
+def memoize(maxsize=1024):
+    """LRU memoization decorator for single argument functions. The cache
+    is exposed as the ``cache`` attribute of the decorated function."""
+    def decorator(func):
+        cache = LRUCache(maxsize)
+
+        @functools.wraps(func)
+        def wrapper(arg):
+            value = cache.get(arg, _missing)
+            if value is _missing:
+                value = cache[arg] = func(arg)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -1,46 +1,93 @@
+import numpy as np
+import scipy.sparse as sp
+
 from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.feature_selection import (
-    SelectPercentile, chi2,
+    SelectKBest, SelectPercentile, chi2,
 )
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import SGDClassifier
 from sklearn.pipeline import Pipeline, FeatureUnion
 from sklearn.preprocessing import MinMaxScaler
 
-from yatiri import tokenize
+from yatiri.analysis import Analyzer
 from yatiri.features import TfidfVectorizer, get_preprocessor, only_camelcase
-from yatiri.stemming import get_stemmer
-from yatiri.stopwords import STOP_WORDS
 
 
 class DenseMatrixTransformer(BaseEstimator, TransformerMixin):
 
+    def __init__(self, dtype=None):
+        self.dtype = dtype
+
     def fit(self, X, y=None):
         return self
 
     def transform(self, X, y=None):
+        if self.dtype:
+            X = X.astype(self.dtype)
         return X.todense()
 
 
+class MaxAbsScaler(BaseEstimator, TransformerMixin):
+    """Scales each feature by its maximum absolute value.
+
+    Keeps sparse input sparse. Non-negative features, like tf-idf
+    weights, end up in [0, 1] as with ``MinMaxScaler``, but without
+    shifting zeros.
+    """
+
+    def fit(self, X, y=None):
+        X = sp.csc_matrix(X)
+        scale = np.zeros(X.shape[1])
+        nonempty = np.diff(X.indptr) > 0
+        if X.nnz:
+            # data of non-empty columns is contiguous in csc format
+            scale[nonempty] = np.maximum.reduceat(
+                np.abs(X.data), X.indptr[:-1][nonempty])
+        scale[scale == 0] = 1
+        self.scale_ = scale
+        return self
+
+    def transform(self, X, y=None):
+        if sp.issparse(X):
+            n = len(self.scale_)
+            return sp.csr_matrix(X) * sp.spdiags(1. / self.scale_, 0, n, n)
+        return X / self.scale_
+
+
 
-def get_tokenizer():
-    stem = get_stemmer().stem
-    def tokenizer(text):
-        tokens = []
-        for token in tokenize.only_ascii_words(text.lower()):
-            if token not in STOP_WORDS:
-                tokens.append(token)
-        return tokens
-    return tokenizer
+def get_tokenizer(stem=False):
+    # input is already normalized by the vectorizer's preprocessor
+    return Analyzer(normalize=False, stem=stem)
 
 
-def default_vectorizer(**defaults):
+def default_vectorizer(stem=False, **defaults):
     defaults.setdefault('analyzer', 'word')
-    defaults.setdefault('tokenizer', get_tokenizer())
+    defaults.setdefault('tokenizer', get_tokenizer(stem))
     defaults.setdefault('strip_accents', None)
     return TfidfVectorizer(**defaults)
 
 
+def hashing_vectorizer(stem=False, **defaults):
+    """Stateless vectorizer, suitable for out-of-core learning."""
+    defaults.setdefault('analyzer', 'word')
+    defaults.setdefault('preprocessor', get_preprocessor())
+    defaults.setdefault('tokenizer', get_tokenizer(stem))
+    defaults.setdefault('ngram_range', (1, 2))
+    defaults.setdefault('n_features', 2 ** 20)
+    return HashingVectorizer(**defaults)
+
+
+def use_stemming(estimator, stem=True):
+    """Sets the default tokenizer, stemming tokens or not, to the
+    vectorizers within ``estimator``."""
+    params = estimator.get_params(deep=True).values() + [estimator]
+    for vect in params:
+        if isinstance(vect, (TfidfVectorizer, HashingVectorizer)):
+            vect.set_params(tokenizer=get_tokenizer(stem))
+
+
 def default_classifier(**defaults):
     defaults.setdefault('alpha', .0001)
     defaults.setdefault('n_iter', 50)
@@ -54,6 +101,12 @@ def default_select(**defaults):
     return SelectPercentile(**defaults)
 
 
+def default_select_k(**defaults):
+    defaults.setdefault('score_func', chi2)
+    defaults.setdefault('k', 500)
+    return SelectKBest(**defaults)
+
+
 def build_model_a():
     title = default_vectorizer()
     return Pipeline([
@@ -138,3 +191,36 @@ def build_model_f():
     ])
 
 
+def build_model_g():
+    """Random forest over the best chi2 features, only the selected
+    columns are densified."""
+    clf = RandomForestClassifier(
+        max_depth=5,
+        n_estimators=10,
+        max_features='auto',
+        random_state=42,
+    )
+
+    return Pipeline([
+        ('vect', default_vectorizer()),
+        ('select', default_select_k()),
+        ('todense', DenseMatrixTransformer(dtype=np.float32)),
+        ('clf', clf),
+    ])
+
+
+def build_model_h():
+    """Sparse counterpart of ``build_model_f``."""
+    return Pipeline([
+        ('vect', default_vectorizer()),
+        ('scaler', MaxAbsScaler()),
+        ('clf', default_classifier()),
+    ])
+
+
+def build_model_stream():
+    """Model trained by mini-batches through ``partial_fit``."""
+    return Pipeline([
+        ('vect', hashing_vectorizer()),
+        ('clf', default_classifier()),
+    ])
@@ -0,0 +1,72 @@
+import base64
+import json
+
+
+def encode_cursor(**state):
+    """Returns the cursor of given state.
+
+    >>> decode_cursor(encode_cursor(value='2012-11-25', seen=3))
+    {'seen': 3, 'value': u'2012-11-25'}
+
+    """
+    return base64.urlsafe_b64encode(json.dumps(state, sort_keys=True))
+
+
+def decode_cursor(cursor):
+    """Returns the cursor state. Raises ``ValueError`` if invalid.
+
+    >>> decode_cursor('foo')
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid cursor 'foo'
+
+    """
+    try:
+        state = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise ValueError("invalid cursor {!r}".format(cursor))
+    if not isinstance(state, dict):
+        raise ValueError("invalid cursor {!r}".format(cursor))
+    return dict((str(k), v) for k, v in state.iteritems())
+
+
+def skip_cursor(cursor, skip):
+    """Returns ``cursor`` moved ``skip`` results forward, so links several
+    pages ahead keep the position instead of using a deep offset.
+
+    >>> decode_cursor(skip_cursor(encode_cursor(value='2012-11-25', seen=3), 20))
+    {'seen': 23, 'value': u'2012-11-25'}
+    >>> decode_cursor(skip_cursor(encode_cursor(offset=40), 20))
+    {'offset': 60}
+
+    """
+    state = decode_cursor(cursor)
+    if 'value' in state:
+        state['seen'] = state.get('seen', 0) + skip
+    else:
+        state['offset'] = state.get('offset', 0) + skip
+    return encode_cursor(**state)
+
+
+def next_position(values, value=None, seen=0):
+    """Returns the last value of the page and how many results had it,
+    given the sort values of the page and the position it started from.
+
+    The next page filters by that value and only skips those results
+    instead of all the previous pages.
+
+    >>> next_position(['b', 'a', 'a'], 'b', 5)
+    ('a', 2)
+    >>> next_position(['b', 'b'], 'b', 5)
+    ('b', 7)
+
+    """
+    last = values[-1]
+    count = 0
+    for v in reversed(values):
+        if v != last:
+            break
+        count += 1
+    if count == len(values) and last == value:
+        count += seen
+    return last, count
@@ -1,3 +1,4 @@
+import leveldb
 import msgpack
 from leveldict import LevelDictEncoded, LevelPool
 
@@ -11,11 +12,13 @@ class MessagePackEncoder(object):
         self.decode = msgpack.loads
 
 
-# single instance
+# single instances
+encoder = MessagePackEncoder()
+
 pool = LevelPool(
     settings.LEVELDB_ROOT,
     leveldb_cls=LevelDictEncoded,
-    encoder=MessagePackEncoder(),
+    encoder=encoder,
 
 )
 
@@ -30,3 +33,30 @@ def staging_db():
 
 def prod_db():
     return pool['prod']
+
+def state_db():
+    return pool['state']
+
+def fingerprint_db():
+    return pool['fingerprint']
+
+def changes_db():
+    return pool['changes']
+
+def tokens_db():
+    return pool['tokens']
+
+def labels_db():
+    return pool['labels']
+
+
+def write_encoded(db, items):
+    """Writes already encoded ``(key, value)`` pairs in a single batch.
+
+    Allows to move the encoding work out of the process that owns the
+    database handle.
+    """
+    batch = leveldb.WriteBatch()
+    for key, value in items:
+        batch.Put(key, value)
+    db._db.Write(batch)
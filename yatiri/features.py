@@ -5,8 +5,8 @@ from sklearn.feature_extraction.text import (
     TfidfVectorizer as _TfidfVectorizer
 )
 
+from yatiri.analysis import Analyzer
 from yatiri.text import normalize_text
-from yatiri.stopwords import STOP_WORDS
 
 
 DEFAULT_FIELDS = (
@@ -24,6 +24,10 @@ def only_camelcase(doc):
         doc['headline'] + ' ' + doc['body'])))
 
 
+def passthrough(doc):
+    return doc
+
+
 def preprocessor(doc, fields):
     return normalize_text('\n'.join(
         doc.get(f, '') for f in fields
@@ -37,10 +41,14 @@ def get_preprocessor(*fields):
 
 
 class TfidfVectorizer(_TfidfVectorizer):
-    stopwords = STOP_WORDS
     sublinear_tf = True
 
     def build_preprocessor(self):
         if self.preprocessor:
             return self.preprocessor
         return get_preprocessor()
+
+    def build_tokenizer(self):
+        if self.tokenizer:
+            return self.tokenizer
+        return Analyzer(normalize=False)
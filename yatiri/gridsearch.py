@@ -0,0 +1,163 @@
+import collections
+import itertools
+import logging
+import math
+
+import numpy as np
+
+from sklearn.base import clone
+from sklearn.externals.joblib import Parallel, delayed
+from sklearn.pipeline import Pipeline
+
+
+logger = logging.getLogger(__name__)
+
+
+def expand_grid(param_grid):
+    """Returns the list of candidates of given grid. Values not given as
+    list or tuple are taken as fixed.
+
+    >>> expand_grid({'a': (1, 2), 'b': [(1, 2)], 'c': 3})
+    [{'a': 1, 'c': 3, 'b': (1, 2)}, {'a': 2, 'c': 3, 'b': (1, 2)}]
+
+    """
+    names = sorted(param_grid)
+    values = [
+        v if isinstance(v, (list, tuple)) else [v]
+        for v in (param_grid[name] for name in names)
+    ]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def split_params(params, final):
+    """Splits candidate parameters into those of the upstream steps and
+    those of the ``final`` step, without prefix.
+
+    >>> split_params({'vect__max_df': .5, 'clf__alpha': .1}, 'clf')
+    ({'vect__max_df': 0.5}, {'alpha': 0.1})
+
+    """
+    prefix = final + '__'
+    upstream, own = {}, {}
+    for name, value in params.iteritems():
+        if name.startswith(prefix):
+            own[name[len(prefix):]] = value
+        else:
+            upstream[name] = value
+    return upstream, own
+
+
+def _take(X, indices):
+    if isinstance(X, np.ndarray):
+        return X[indices]
+    return [X[i] for i in indices]
+
+
+def _fit_group(estimator, upstream, finals, X, y, train, test, score_func):
+    """Fits the upstream steps once and scores every final step
+    parameters on top of the transformed fold."""
+    pipeline = clone(estimator)
+    pipeline.set_params(**upstream)
+    name, final = pipeline.steps[-1]
+    transformer = Pipeline(pipeline.steps[:-1])
+
+    y = np.asarray(y)
+    Xt_train = transformer.fit_transform(_take(X, train), y[train])
+    Xt_test = transformer.transform(_take(X, test))
+
+    scores = []
+    for params in finals:
+        clf = clone(final)
+        clf.set_params(**params)
+        clf.fit(Xt_train, y[train])
+        if score_func:
+            scores.append(score_func(y[test], clf.predict(Xt_test)))
+        else:
+            scores.append(clf.score(Xt_test, y[test]))
+    return scores
+
+
+class CachedGridSearch(object):
+    """Exhaustive search over a ``Pipeline`` parameter grid.
+
+    Candidates sharing the parameters of the upstream steps (i.e. the
+    vectorizer) are grouped, so those steps are fitted once per fold and
+    group instead of once per candidate. Group and fold pairs run in
+    parallel.
+
+    With ``halving``, candidates are evaluated in rounds with a growing
+    fraction of each training fold and only the best ``1/eta`` of them
+    advance to the next round (successive halving).
+    """
+
+    def __init__(self, estimator, param_grid, cv, n_jobs=-1,
+                 score_func=None, halving=False, eta=3, verbose=0):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.score_func = score_func
+        self.halving = halving
+        self.eta = eta
+        self.verbose = verbose
+
+    def _evaluate(self, candidates, X, y, folds, fraction=1.):
+        final = self.estimator.steps[-1][0]
+        groups = collections.OrderedDict()
+        for i, params in enumerate(candidates):
+            upstream, own = split_params(params, final)
+            key = repr(sorted(upstream.items()))
+            groups.setdefault(key, (upstream, [], []))
+            groups[key][1].append(own)
+            groups[key][2].append(i)
+
+        jobs = []
+        for upstream, finals, _ in groups.itervalues():
+            for train, test in folds:
+                train = train[:max(1, int(len(train) * fraction))]
+                jobs.append(delayed(_fit_group)(
+                    self.estimator, upstream, finals, X, y, train, test,
+                    self.score_func))
+        logger.debug("Fitting {} candidates in {} groups over {} folds".format(
+            len(candidates), len(groups), len(folds)))
+        out = Parallel(n_jobs=self.n_jobs, verbose=self.verbose)(jobs)
+
+        scores = [[] for _ in candidates]
+        out = iter(out)
+        for _, _, indices in groups.itervalues():
+            for _ in folds:
+                for i, score in zip(indices, out.next()):
+                    scores[i].append(score)
+        return [np.mean(s) for s in scores]
+
+    def fit(self, X, y):
+        folds = list(self.cv)
+        candidates = expand_grid(self.param_grid)
+        self.grid_scores_ = []
+
+        n_rounds = 1
+        if self.halving and len(candidates) > 1:
+            n_rounds = int(math.ceil(math.log(len(candidates), self.eta)))
+
+        for round_ in xrange(n_rounds):
+            # last round uses the whole training folds
+            fraction = float(self.eta) ** (round_ - n_rounds + 1)
+            scores = self._evaluate(candidates, X, y, folds, fraction)
+            ranked = sorted(zip(scores, range(len(candidates))),
+                            reverse=True)
+            for score, i in ranked:
+                self.grid_scores_.append((candidates[i], score, fraction))
+            logger.info("Round {}: {} candidates with {:.0%} of the data, "
+                        "best score {:.3f}".format(
+                            round_ + 1, len(candidates), fraction,
+                            ranked[0][0]))
+            if round_ < n_rounds - 1:
+                keep = int(math.ceil(len(candidates) / float(self.eta)))
+                candidates = [candidates[i] for _, i in ranked[:keep]]
+
+        self.best_score_, best = ranked[0]
+        self.best_params_ = candidates[best]
+        self.best_estimator_ = clone(self.estimator)
+        self.best_estimator_.set_params(**self.best_params_)
+        self.best_estimator_.fit(X, y)
+        return self
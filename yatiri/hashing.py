@@ -1,4 +1,5 @@
 import hashlib
+import json
 import logging
 import re
 
@@ -43,3 +44,20 @@ def doc_guid(doc):
     else:
         h.update(url)
     return h.hexdigest()
+
+
+def doc_fingerprint(doc):
+    """Returns compact digest of the document contents.
+
+    >>> doc1 = {'url': 'url1', 'images': ['a', 'b']}
+    >>> doc2 = {'images': ['a', 'b'], 'url': 'url1'}
+    >>> doc_fingerprint(doc1) == doc_fingerprint(doc2)
+    True
+    >>> doc_fingerprint(doc1) == doc_fingerprint({'url': 'url2'})
+    False
+    >>> len(doc_fingerprint(doc1))
+    8
+
+    """
+    data = json.dumps(doc, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(data).digest()[:8]
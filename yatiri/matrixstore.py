@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import scipy.sparse as sp
+
+from yatiri import settings
+
+
+CSR_ARRAYS = (
+    'data',
+    'indices',
+    'indptr',
+)
+
+
+def matrix_key(**params):
+    """Returns store key for given corpus slice and vectorizer parameters.
+
+    >>> matrix_key(fields=['body'], ngram_range=(1, 2))
+    'a7881eaadbed9ecb'
+
+    """
+    data = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def _path(key, root=None):
+    return os.path.join(root or settings.MATRIX_ROOT, key)
+
+
+def save_matrix(key, X, feature_names, doc_keys, params=None, root=None):
+    """Stores CSR matrix ``X`` along with its column names and row keys."""
+    path = _path(key, root)
+    parent = os.path.dirname(path)
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+
+    # write to a temporary directory and move it at once
+    tmppath = tempfile.mkdtemp(prefix='.{}-'.format(key), dir=parent)
+    try:
+        X = sp.csr_matrix(X)
+        for name in CSR_ARRAYS:
+            np.save(os.path.join(tmppath, name + '.npy'), getattr(X, name))
+        with open(os.path.join(tmppath, 'meta.json'), 'wb') as fp:
+            json.dump({
+                'shape': X.shape,
+                'params': params,
+                'features': list(feature_names),
+                'keys': list(doc_keys),
+            }, fp)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.rename(tmppath, path)
+    except:
+        shutil.rmtree(tmppath, ignore_errors=True)
+        raise
+
+
+def load_matrix(key, mmap_mode='r', root=None):
+    """Returns ``(X, feature_names, doc_keys)`` or ``None`` if the matrix
+    is not stored. Arrays are memory-mapped unless ``mmap_mode`` is None.
+    """
+    path = _path(key, root)
+    if not os.path.exists(path):
+        return None
+    with open(os.path.join(path, 'meta.json'), 'rb') as fp:
+        meta = json.load(fp)
+    arrays = [
+        np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+        for name in CSR_ARRAYS
+    ]
+    X = sp.csr_matrix(tuple(arrays), shape=tuple(meta['shape']), copy=False)
+    return X, meta['features'], meta['keys']
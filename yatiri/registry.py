@@ -0,0 +1,140 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from sklearn.externals import joblib
+
+from yatiri import settings
+from yatiri.hashing import doc_guid
+
+
+MODEL_FILE = 'model.pkl'
+META_FILE = 'meta.json'
+
+
+class TrainingFingerprint(object):
+    """Accumulates the labelled documents of a training pass, keeping only
+    their guids, and returns the same digest as ``training_fingerprint``.
+
+    >>> fp = TrainingFingerprint()
+    >>> fp.update({'guid': 'b'}, 'deportes')
+    >>> fp.update({'guid': 'a'}, 'politica')
+    >>> fp.hexdigest() == training_fingerprint(
+    ...     [{'guid': 'a'}, {'guid': 'b'}], ['politica', 'deportes'])
+    True
+
+    """
+
+    def __init__(self):
+        self.pairs = []
+
+    def update(self, doc, target):
+        self.pairs.append((doc.get('guid') or doc_guid(doc), unicode(target)))
+
+    def hexdigest(self):
+        h = hashlib.sha1()
+        for guid, target in sorted(self.pairs):
+            h.update(guid)
+            h.update(target.encode('utf-8'))
+        return h.hexdigest()
+
+
+def training_fingerprint(docs, targets):
+    """Returns a digest of the labelled documents, independent of their
+    order."""
+    fp = TrainingFingerprint()
+    for doc, target in zip(docs, targets):
+        fp.update(doc, target)
+    return fp.hexdigest()
+
+
+def parse_spec(spec):
+    """Parses ``name[:version]`` model references.
+
+    >>> parse_spec('base')
+    ('base', None)
+    >>> parse_spec('base:3')
+    ('base', 3)
+
+    """
+    name, _, version = spec.partition(':')
+    return name, int(version) if version else None
+
+
+class ModelRegistry(object):
+    """Versioned store of fitted models.
+
+    Models are saved with joblib without compression, so their numpy
+    arrays (i.e. ``coef_``, idf vectors) live in separate files which
+    are memory-mapped on load and shared among processes through the
+    page cache.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or settings.MODEL_ROOT
+
+    def _path(self, name, version=None):
+        if version is None:
+            return os.path.join(self.root, name)
+        return os.path.join(self.root, name, str(version))
+
+    def versions(self, name):
+        path = self._path(name)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(v) for v in os.listdir(path) if v.isdigit())
+
+    def latest(self, name):
+        versions = self.versions(name)
+        if not versions:
+            raise KeyError("No versions for model {!r}".format(name))
+        return versions[-1]
+
+    def save(self, name, model, fingerprint=None, metrics=None):
+        """Stores a new version of ``model``. Returns the version."""
+        parent = self._path(name)
+        if not os.path.exists(parent):
+            os.makedirs(parent)
+        tmppath = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+        try:
+            joblib.dump(model, os.path.join(tmppath, MODEL_FILE))
+            versions = self.versions(name)
+            version = versions[-1] + 1 if versions else 1
+            meta = {
+                'name': name,
+                'version': version,
+                'created': datetime.datetime.utcnow().isoformat(),
+                'fingerprint': fingerprint,
+                'metrics': metrics or {},
+                'model': repr(model),
+            }
+            with open(os.path.join(tmppath, META_FILE), 'wb') as fp:
+                json.dump(meta, fp, indent=2)
+            os.rename(tmppath, self._path(name, version))
+        except:
+            shutil.rmtree(tmppath, ignore_errors=True)
+            raise
+        return version
+
+    def metadata(self, name, version=None):
+        if version is None:
+            version = self.latest(name)
+        with open(os.path.join(self._path(name, version), META_FILE)) as fp:
+            return json.load(fp)
+
+    def load(self, name, version=None, mmap_mode='r'):
+        """Loads given version of the model, the latest by default."""
+        if version is None:
+            version = self.latest(name)
+        path = os.path.join(self._path(name, version), MODEL_FILE)
+        if not os.path.exists(path):
+            raise KeyError("Model {!r} version {} not found".format(
+                name, version))
+        return joblib.load(path, mmap_mode=mmap_mode)
+
+    def load_spec(self, spec, mmap_mode='r'):
+        name, version = parse_spec(spec)
+        return self.load(name, version, mmap_mode)
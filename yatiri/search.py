@@ -1,10 +1,17 @@
+import json
 
 from cyclone import web
 from txrho.xapian import SearchPool
 from twisted.internet import reactor, defer
+from twisted.internet.task import LoopingCall
+from twisted.python.failure import Failure
 
 from yatiri import settings
-from yatiri.batch.search import query as execute_query
+from yatiri.batch.search import (
+    get_generation, run_current, run_search, run_searches,
+)
+from yatiri.cache import LRUCache
+from yatiri.cursors import decode_cursor
 from yatiri.web import BaseHandler as _BaseHandler
 
 
@@ -13,6 +20,178 @@ SETTINGS_MAP = (
 )
 
 
+class QueryCache(object):
+    """Search results cache. Identical queries arriving while one is
+    running wait for its result instead of running again.
+
+    Results are discarded when the index generation changes.
+    """
+
+    def __init__(self, maxsize, dbpath=None):
+        self.dbpath = dbpath
+        self.results = LRUCache(maxsize)
+        self.pending = {}
+        self.coalesced = 0
+        self.generation = get_generation(dbpath)
+
+    def check_generation(self):
+        generation = get_generation(self.dbpath)
+        if generation != self.generation:
+            self.generation = generation
+            self.results.clear()
+
+    def get(self, key, func, *args, **kwargs):
+        """Returns a deferred with the cached result of ``key`` or the
+        result of calling ``func``."""
+        result = self.results.get(key)
+        if result is not None:
+            return defer.succeed(result)
+
+        if key in self.pending:
+            self.coalesced += 1
+            d = defer.Deferred()
+            self.pending[key].append(d)
+            return d
+
+        waiting = self.pending[key] = []
+        generation = self.generation
+
+        def _done(result):
+            del self.pending[key]
+            failed = isinstance(result, Failure)
+            if not failed and generation == self.generation:
+                self.results[key] = result
+            for d in waiting:
+                if failed:
+                    d.errback(result)
+                else:
+                    d.callback(result)
+            return result
+
+        return defer.maybeDeferred(func, *args, **kwargs).addBoth(_done)
+
+    def get_many(self, keys, queries, func, *args):
+        """Returns a deferred with the results of the queries, calling
+        ``func`` once with ``args`` and the list of queries not cached.
+
+        >>> cache = QueryCache(10, '/nonexistent')
+        >>> def upper(queries):
+        ...     print 'running', queries
+        ...     return [q.upper() for q in queries]
+        >>> results = []
+        >>> _ = cache.get_many(['a', 'b'], ['a', 'b'], upper)
+        running ['a', 'b']
+        >>> _ = cache.get_many(['a', 'c'], ['a', 'c'], upper).addCallback(
+        ...     results.append)
+        running ['c']
+        >>> results
+        [['A', 'C']]
+
+        """
+        results = [self.results.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return defer.succeed(results)
+
+        generation = self.generation
+
+        def _done(found):
+            for i, result in zip(missing, found):
+                results[i] = result
+                if generation == self.generation:
+                    self.results[keys[i]] = result
+            return results
+
+        args += ([queries[i] for i in missing],)
+        d = defer.maybeDeferred(func, *args)
+        return d.addCallback(_done)
+
+    def stats(self):
+        stats = self.results.stats()
+        stats.update({
+            'coalesced': self.coalesced,
+            'pending': len(self.pending),
+            'generation': self.generation,
+        })
+        return stats
+
+
+def query_key(q, categories, date, offset, limit, sortby, fields,
+              cursor=None):
+    """Returns the cache key of the search arguments.
+
+    >>> query_key(' a  b', ['y', 'x'], None, 0, 10, None, [])
+    ('a b', ('x', 'y'), None, 0, 10, None, (), None)
+
+    """
+    return (' '.join(q.split()), tuple(sorted(set(categories))), date,
+            offset, limit, sortby, tuple(sorted(set(fields))), cursor)
+
+
+def search_kwargs(spec):
+    """Returns the ``run_search`` arguments of a query spec, given as the
+    /search request arguments. Raises ``ValueError`` with the error
+    reason if invalid.
+
+    >>> search_kwargs({'q': ['lima'], 'limit': ['5']})['limit']
+    5
+    >>> search_kwargs({'q': 3})
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid_q
+
+    """
+    def arg(name, default=None):
+        value = spec.get(name, default)
+        if isinstance(value, list):
+            value = value[0] if value else default
+        return value
+
+    def text(name, default=None):
+        value = arg(name, default)
+        if value is not None and not isinstance(value, basestring):
+            raise ValueError('invalid_{}'.format(name))
+        return value
+
+    def texts(name):
+        value = spec.get(name) or []
+        value = value if isinstance(value, list) else [value]
+        if not all(isinstance(v, basestring) for v in value):
+            raise ValueError('invalid_{}'.format(name))
+        return value
+
+    try:
+        offset = int(arg('offset', 0))
+    except (TypeError, ValueError):
+        raise ValueError('invalid_offset')
+    if offset < 0:
+        raise ValueError('invalid_offset')
+
+    try:
+        limit = int(arg('limit', 10))
+    except (TypeError, ValueError):
+        raise ValueError('invalid_limit')
+    if limit < 0:
+        raise ValueError('invalid_limit')
+
+    cursor = text('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise ValueError('invalid_cursor')
+
+    return dict(
+        q=text('q', ''),
+        categories=texts('category'),
+        date=text('date'),
+        offset=offset,
+        limit=limit,
+        sortby=text('sortby'),
+        fields=texts('fields'),
+        cursor=cursor,
+    )
+
 
 class BaseHandler(_BaseHandler):
 
@@ -20,8 +199,15 @@ class BaseHandler(_BaseHandler):
     def searchpool(self):
         return self.settings['searchpool']
 
-    def run(self, *args, **kwargs):
-        return self.searchpool.runWithConnection(*args, **kwargs)
+    @property
+    def querycache(self):
+        return self.settings['querycache']
+
+    def run(self, func, *args, **kwargs):
+        # connections are reopened on generation changes so new results
+        # aren't cached from an old revision
+        return self.searchpool.runWithConnection(
+            run_current, self.querycache.generation, func, *args, **kwargs)
 
     def success(self, data):
         data.setdefault('ok', True)
@@ -30,6 +216,14 @@ class BaseHandler(_BaseHandler):
     def error(self, reason):
         self.finish({'error': True, 'reason': reason})
 
+    def bad_request(self, reason):
+        self.set_status(400)
+        self.error(reason)
+
+    def _on_failure(self, failure):
+        self.logerr(failure)
+        self.error('search_failed')
+
 
 class IndexHandler(BaseHandler):
 
@@ -40,6 +234,8 @@ class IndexHandler(BaseHandler):
     def _on_conn(self, conn):
         self.success({
             'documents': conn.get_doccount(),
+            'generation': get_generation(),
+            'cache': self.querycache.stats(),
         })
 
 
@@ -48,69 +244,57 @@ class SearchHandler(BaseHandler):
 
     @web.asynchronous
     def get(self):
-        q = self.get_arg('q', '')
-
         try:
-            offset = int(self.get_arg('offset', 0))
-        except ValueError:
-            return self.error('invalid_offset')
+            kwargs = search_kwargs(self.request.arguments)
+        except ValueError as e:
+            return self.bad_request(str(e))
+
+        self.log('Query: {!r}'.format(kwargs))
+        key = query_key(**kwargs)
+        d = self.querycache.get(key, self.run, run_search, **kwargs)
+        d.addCallbacks(self.success, self._on_failure)
+        return d
+
 
-        if offset < 0:
-            return self.error('invalid_offset')
+class MultiSearchHandler(BaseHandler):
+    """Runs a JSON list of /search arguments on a single connection."""
 
+    # queries per request
+    max_queries = 50
+
+    @web.asynchronous
+    def post(self):
         try:
-            limit = int(self.get_arg('limit', 10))
+            specs = json.loads(self.request.body)
         except ValueError:
-            return self.error('invalid_limit')
-
-        if limit < 0:
-            return self.error('invalid_limit')
-
-        return self.run(self._query, q, offset, limit)
-
-    def _query(self, sconn, q, offset, limit):
-        if q:
-            q = sconn.query_parse(q)
-        else:
-            q = sconn.query_all()
-
-        categories = self.get_args('category')
-        if categories:
-            qc = sconn.query_composite(
-                sconn.OP_OR, [
-                    sconn.query_field('category', value)
-                    for value in categories
-                ])
-            #q = sconn.query_composite(
-            #    sconn.OP_AND, [q, qc])
-            q = q.filter(qc)
-
-        date = self.get_arg('date')
-        if date:
-            qd = sconn.query_field('date', date)
-            q = q.filter(qd)
-
-        sortby = self.get_arg('sortby')
-        if sortby:
-            sortby = [sortby]
-        else:
-            sortby = None
-
-        self.log('Query: {!r}'.format(q))
-        results = execute_query(sconn, q, offset, limit, sortby=sortby)
-        self.success({
-            'total': results.matches_estimated,
-            'is_exact': results.estimate_is_exact,
-            'docs': [
-                dict(id=r.id, category=r.get_terms('category').next()) for r in results
-            ]
-        })
+            return self.bad_request('invalid_json')
+        if not isinstance(specs, list) or not all(
+                isinstance(spec, dict) for spec in specs):
+            return self.bad_request('invalid_json')
+        if len(specs) > self.max_queries:
+            return self.bad_request('too_many_queries')
+
+        try:
+            queries = [search_kwargs(spec) for spec in specs]
+        except ValueError as e:
+            return self.bad_request(str(e))
+
+        self.log('Queries: {}'.format(len(queries)))
+        keys = [query_key(**kwargs) for kwargs in queries]
+        d = self.querycache.get_many(keys, queries, self.run,
+                                     run_searches)
+        d.addCallbacks(self._on_results, self._on_failure)
+        return d
+
+    def _on_results(self, results):
+        self.success({'results': results})
 
 
 def get_app():
     handlers = [
         (r'/', IndexHandler),
         (r'/search', SearchHandler),
+        (r'/msearch', MultiSearchHandler),
     ]
     app_settings = dict(
         (k, getattr(settings, v.upper())) for (k,v) in SETTINGS_MAP
@@ -119,5 +303,10 @@ def get_app():
     searchpool = SearchPool(settings.XAPIAN_DB)
     reactor.callWhenRunning(searchpool.start)
     app_settings['searchpool'] = searchpool
+    # results cache, cleared on index updates
+    querycache = QueryCache(settings.RESULT_CACHE_SIZE, settings.XAPIAN_DB)
+    reactor.callWhenRunning(LoopingCall(querycache.check_generation).start,
+                            settings.GENERATION_POLL_INTERVAL, now=False)
+    app_settings['querycache'] = querycache
 
     return web.Application(handlers, **app_settings)
@@ -1,30 +1,161 @@
 import json
 
+from StringIO import StringIO
 from urllib import urlencode
 from urlparse import urljoin
-from twisted.internet import defer
-from cyclone import httpclient
+from twisted.internet import defer, reactor
+from twisted.web.client import (
+    Agent, FileBodyProducer, HTTPConnectionPool, readBody,
+)
+from twisted.web.http_headers import Headers
+
+try:
+    from ujson import loads as json_loads
+except ImportError:
+    try:
+        from simplejson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+
+class SearchError(Exception):
+    """Error reported by the search service."""
+
+
+def query_spec(query, categories=(), **kwargs):
+    """Returns the /search arguments of ``search`` arguments.
+
+    >>> sorted(query_spec('lima', ['politica'], limit=3, cursor=None).items())
+    [('category', ['politica']), ('limit', 3), ('q', 'lima')]
+
+    """
+    spec = dict((k, v) for k, v in kwargs.iteritems() if v is not None)
+    spec.update({
+        'q': query,
+        'category': list(categories),
+    })
+    return spec
 
 
 class SearchClient(object):
+    """Search service client keeping persistent connections to the
+    endpoint.
+
+    ``pool_size`` is the number of idle connections kept open, closed
+    after ``idle_timeout`` seconds. ``timeout`` limits the wait for a
+    response.
+    """
+
+    headers = Headers({'User-Agent': ['yatiri']})
 
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, pool_size=10, connect_timeout=5,
+                 idle_timeout=240, timeout=30):
         self.endpoint = endpoint
+        self.timeout = timeout
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = pool_size
+        self.pool.cachedConnectionTimeout = idle_timeout
+        self.agent = Agent(reactor, connectTimeout=connect_timeout,
+                           pool=self.pool)
 
-    def fetch(self, url, *args, **kwargs):
-        return httpclient.fetch(url, *args, **kwargs)
+    def close(self):
+        return self.pool.closeCachedConnections()
+
+    def _request(self, method, url, body=None):
+        """Returns the response body. The timeout covers both waiting for
+        the response and reading its body."""
+        d = self.agent.request(method, url, self.headers, body)
+        d.addCallback(readBody)
+        if self.timeout:
+            call = reactor.callLater(self.timeout, d.cancel)
+            def _cancel_timeout(result):
+                if call.active():
+                    call.cancel()
+                return result
+            d.addBoth(_cancel_timeout)
+        return d
+
+    @defer.inlineCallbacks
+    def fetch(self, path, **params):
+        """Returns the decoded JSON response of given path."""
+        url = urljoin(self.endpoint, path)
+        if params:
+            url += '?' + urlencode(params, doseq=1)
+        body = yield self._request('GET', url)
+        defer.returnValue(json_loads(body))
 
     @defer.inlineCallbacks
+    def post(self, path, data):
+        """Posts ``data`` as JSON and returns the decoded response."""
+        url = urljoin(self.endpoint, path)
+        body = yield self._request(
+            'POST', url, FileBodyProducer(StringIO(json.dumps(data))))
+        defer.returnValue(json_loads(body))
+
+    def status(self):
+        """Returns the index status (documents count and generation)."""
+        return self.fetch('/')
+
     def search(self, query, categories=(),  **kwargs):
-        kwargs.update({
-            'q': query,
-            'category': categories,
-        })
-        url = urljoin(self.endpoint, '/search?{}'.format(
-            urlencode(kwargs, doseq=1)))
-        result = yield self.fetch(url)
-        data = json.loads(result.body)
-        defer.returnValue(data)
+        """Returns the search results. Pass the ``cursor`` of the results
+        to get the next page."""
+        return self.fetch('/search', **query_spec(query, categories, **kwargs))
+
+    @defer.inlineCallbacks
+    def multi_search(self, queries):
+        """Runs the searches given as ``search`` keyword arguments in a
+        single request. Returns the results in the same order."""
+        data = yield self.post('/msearch', [
+            query_spec(**kwargs) for kwargs in queries
+        ])
+        if 'error' in data:
+            raise SearchError(data.get('reason'))
+        defer.returnValue(data['results'])
+
+
+class EmbeddedSearchClient(object):
+    """Same interface as ``SearchClient`` but running the searches on a
+    local xapian database, without the HTTP hop to the search service."""
+
+    def __init__(self, dbpath):
+        # xapian is only required in embedded mode
+        from txrho.xapian import SearchPool
+        from yatiri.batch.search import (
+            get_generation, run_current, run_search, run_searches,
+        )
+        self.dbpath = dbpath
+        self.pool = SearchPool(dbpath)
+        self.generation = get_generation(dbpath)
+        self._get_generation = get_generation
+        self._run_current = run_current
+        self._run_search = run_search
+        self._run_searches = run_searches
+
+    def start(self):
+        self.pool.start()
+
+    def _run(self, func, *args, **kwargs):
+        # reopens connections older than the last seen generation
+        return self.pool.runWithConnection(
+            self._run_current, self.generation, func, *args, **kwargs)
+
+    def _status(self, sconn):
+        self.generation = self._get_generation(self.dbpath)
+        return {
+            'documents': sconn.get_doccount(),
+            'generation': self.generation,
+        }
+
+    def status(self):
+        return self.pool.runWithConnection(self._status)
 
+    def search(self, query, categories=(), **kwargs):
+        return self._run(self._run_search, query, categories, **kwargs)
 
+    def multi_search(self, queries):
+        queries = [self._run_kwargs(**kwargs) for kwargs in queries]
+        return self._run(self._run_searches, queries)
 
+    def _run_kwargs(self, query, categories=(), **kwargs):
+        kwargs.update(q=query, categories=categories)
+        return kwargs
@@ -7,6 +7,8 @@ PROJECT_ROOT = dirname(dirname(__file__))
 
 LEVELDB_ROOT = join(PROJECT_ROOT, 'databases')
 XAPIAN_DB = join(PROJECT_ROOT, 'xapiandb')
+MATRIX_ROOT = join(PROJECT_ROOT, 'matrices')
+MODEL_ROOT = join(PROJECT_ROOT, 'models')
 
 # web settings
 STATIC_PATH = join(PROJECT_ROOT, 'static')
@@ -15,8 +17,23 @@ COOKIE_SECRET = '32oETzKXQAGaYdkL5gEmGeJJFuYh7EQnp2XdTP1o/Vo='
 LOGIN_URL = '/login'
 LOGOUT_URL = '/logout'
 SEARCH_ENDPOINT = 'http://localhost:9999/'
+# search XAPIAN_DB in the frontend process instead of SEARCH_ENDPOINT
+SEARCH_EMBEDDED = False
+# persistent connections to the search service
+SEARCH_POOL_SIZE = 10
+SEARCH_CONNECT_TIMEOUT = 5
+SEARCH_IDLE_TIMEOUT = 240
+SEARCH_TIMEOUT = 30
+# threads reading the corpus db
+LEVELDB_THREADS = 8
+# rendered pages cache
+RESPONSE_CACHE_SIZE = 1000
+RESPONSE_CACHE_TTL = 300
+# seconds between index generation checks
+GENERATION_POLL_INTERVAL = 10
 
 # search settings
+RESULT_CACHE_SIZE = 10000
 
 
 try:
@@ -1,8 +1,54 @@
 from nltk.stem import SnowballStemmer
+from yatiri.cache import LRUCache
 from yatiri.stopwords import STOP_WORDS
 
 
+# news vocabulary is zipfian, a moderate cache gets most of the hits
+CACHE_SIZE = 100000
+
+
 def get_stemmer():
     stemmer = SnowballStemmer('spanish')
     stemmer.stopwords = set(STOP_WORDS)
     return stemmer
+
+
+class CachedStemmer(object):
+    """Spanish stemmer memoizing results in a bounded LRU cache."""
+
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self._setup()
+
+    def _setup(self):
+        self._stem = get_stemmer().stem
+        self.cache = LRUCache(self.cache_size)
+
+    @property
+    def hit_rate(self):
+        return self.cache.hit_rate
+
+    def stem(self, token):
+        value = self.cache.get(token)
+        if value is None:
+            value = self.cache[token] = self._stem(token)
+        return value
+
+    def stem_many(self, tokens):
+        """Returns stems for given tokens, in order."""
+        get, stem, cache = self.cache.get, self._stem, self.cache
+        stems = []
+        for token in tokens:
+            value = get(token)
+            if value is None:
+                value = cache[token] = stem(token)
+            stems.append(value)
+        return stems
+
+    # pickle only the settings, the cache is rebuilt on load
+    def __getstate__(self):
+        return {'cache_size': self.cache_size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
@@ -3,7 +3,7 @@ from sklearn.feature_extraction.text import strip_accents_ascii
 
 
 # normalized stopwords
-STOP_WORDS = map(lambda s: s.decode('utf-8'), nltk_stopwords.words('spanish'))
-STOP_WORDS = map(strip_accents_ascii, STOP_WORDS)
-STOP_WORDS += [
-]
+STOP_WORDS = frozenset(
+    strip_accents_ascii(s.decode('utf-8'))
+    for s in nltk_stopwords.words('spanish')
+)
@@ -1,4 +1,38 @@
-from sklearn.feature_extraction.text import strip_accents_ascii
+import re
+import unicodedata
+
+from yatiri.cache import memoize
+
+
+RE_NON_ASCII = re.compile(u'[^\x00-\x7f]+')
+
+# short fields (i.e. headlines, site names) worth memoizing
+MEMO_MAX_LENGTH = 200
+MEMO_SIZE = 10000
+
+
+class AsciiTable(dict):
+    """Translation table from unicode code points to their ascii
+    decomposition, or ``None`` when there is no ascii equivalent.
+
+    Code points missing from the table are computed on first use.
+    """
+
+    def __missing__(self, codepoint):
+        value = unicodedata.normalize('NFKD', unichr(codepoint))
+        value = value.encode('ascii', 'ignore').decode('ascii') or None
+        self[codepoint] = value
+        return value
+
+
+# precompute latin-1 supplement and latin extended-a
+ASCII_TABLE = AsciiTable()
+for _codepoint in xrange(0x80, 0x180):
+    ASCII_TABLE[_codepoint]
+
+
+def _translate(match):
+    return match.group().translate(ASCII_TABLE)
 
 
 def remove_non_ascii(s):
@@ -6,12 +40,28 @@ def remove_non_ascii(s):
 
 
 def normalize_text(text):
-    """Basic normalization without altering the semantic"""
+    """Basic normalization without altering the semantic
+
+    >>> normalize_text(u'Acci\\xf3n r\\xe1pida \\u2013 \\xbfqu\\xe9?')
+    u'Accion rapida  que?'
+    >>> normalize_text('ni\\xc3\\xb1o')
+    u'nino'
+
+    """
     if isinstance(text, str):
-        # strip_accents_ascii requires unicode test
         text = text.decode('utf-8')
-    text = strip_accents_ascii(text)
-    text = remove_non_ascii(text)
+    try:
+        text.encode('ascii')
+    except UnicodeEncodeError:
+        return RE_NON_ASCII.sub(_translate, text)
     return text
 
 
+_normalize_text_memo = memoize(MEMO_SIZE)(normalize_text)
+
+
+def normalize_text_cached(text):
+    """Same as ``normalize_text`` but memoizing short values."""
+    if len(text) > MEMO_MAX_LENGTH:
+        return normalize_text(text)
+    return _normalize_text_memo(text)
@@ -0,0 +1,177 @@
+import array
+import functools
+import hashlib
+import logging
+
+from yatiri import datastore
+from yatiri.features import TfidfVectorizer, passthrough
+from yatiri.hashing import doc_fingerprint, doc_guid
+
+
+logger = logging.getLogger(__name__)
+
+VOCAB_PREFIX = 'vocab:'
+DOCS_KEY = 'docs:{}:{}:{}'
+
+
+def describe(func):
+    """Returns a stable description of a preprocessor or tokenizer."""
+    if isinstance(func, functools.partial):
+        keywords = sorted((func.keywords or {}).items())
+        return (describe(func.func), func.args, tuple(keywords))
+    if hasattr(func, 'config'):
+        return func.config
+    return '{}.{}'.format(func.__module__, func.__name__)
+
+
+def config_id(preprocessor, tokenizer):
+    config = (describe(preprocessor), describe(tokenizer))
+    return hashlib.sha1(repr(config)).hexdigest()[:16]
+
+
+class TokenCache(object):
+    """Persistent cache of analyzed documents.
+
+    Entries are keyed by analyzer config, document guid and content
+    fingerprint, so a document updated under the same guid is analyzed
+    again. They are stored as arrays of ids into a vocabulary shared by
+    all configs.
+
+    Copies of the cache sent to other processes (i.e. within pickled
+    models) keep the loaded data but never write to the database.
+    """
+
+    def __init__(self, db=None):
+        self.db = datastore.tokens_db() if db is None else db
+        self.tokens = []
+        self.ids = {}
+        self._pending = {}
+        self._load_vocabulary()
+
+    def _load_vocabulary(self):
+        vocab = self.db.range(VOCAB_PREFIX, VOCAB_PREFIX[:-1] + ';')
+        for key, token_id in vocab:
+            token = key[len(VOCAB_PREFIX):].decode('utf-8')
+            self.ids[token] = token_id
+        self.tokens = [None] * len(self.ids)
+        for token, token_id in self.ids.iteritems():
+            self.tokens[token_id] = token
+
+    def _token_id(self, token):
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = self.ids[token] = len(self.tokens)
+            self.tokens.append(token)
+            key = VOCAB_PREFIX + token.encode('utf-8')
+            self._pending[key] = token_id
+        return token_id
+
+    def get(self, config, guid, fingerprint):
+        """Returns cached token ids or ``None``."""
+        if self.db is None:
+            return None
+        value = self.db.get(DOCS_KEY.format(config, guid, fingerprint))
+        if value is not None:
+            return array.array('I', value)
+
+    def put(self, config, guid, fingerprint, tokens):
+        """Stores ``tokens`` and returns their ids."""
+        ids = array.array('I', (self._token_id(t) for t in tokens))
+        key = DOCS_KEY.format(config, guid, fingerprint)
+        self._pending[key] = ids.tostring()
+        return ids
+
+    def flush(self):
+        if self.db is None or not self._pending:
+            return
+        with self.db.write_batch() as wb:
+            for key, value in self._pending.iteritems():
+                wb[key] = value
+        logger.debug("Flushed {} token cache entries".format(
+            len(self._pending)))
+        self._pending = {}
+
+    def analysis(self, preprocessor, tokenizer):
+        return CachedAnalysis(self, preprocessor, tokenizer)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['db'] = None
+        state['_pending'] = {}
+        return state
+
+
+class CachedAnalysis(object):
+    """Tokenizer taking raw documents and returning their cached tokens,
+    to be used along with a ``passthrough`` preprocessor."""
+
+    def __init__(self, cache, preprocessor, tokenizer):
+        self.cache = cache
+        self.preprocessor = preprocessor
+        self.tokenizer = tokenizer
+        self.config = config_id(preprocessor, tokenizer)
+        self.memo = {}
+        # (doc, key) by document identity
+        self.keys = {}
+
+    def _key(self, doc):
+        # hashing the whole document is done once per document object,
+        # not on every pass over the dataset
+        entry = self.keys.get(id(doc))
+        if entry is not None and entry[0] is doc:
+            return entry[1]
+        key = (doc.get('guid') or doc_guid(doc),
+               doc_fingerprint(doc).encode('hex'))
+        self.keys[id(doc)] = (doc, key)
+        return key
+
+    def token_ids(self, doc):
+        key = self._key(doc)
+        ids = self.memo.get(key)
+        if ids is None:
+            guid, fingerprint = key
+            ids = self.cache.get(self.config, guid, fingerprint)
+            if ids is None:
+                tokens = self.tokenizer(self.preprocessor(doc))
+                ids = self.cache.put(self.config, guid, fingerprint, tokens)
+            self.memo[key] = ids
+        return ids
+
+    def __call__(self, doc):
+        tokens = self.cache.tokens
+        return [tokens[i] for i in self.token_ids(doc)]
+
+    def __getstate__(self):
+        # identities are meaningless in other processes
+        state = self.__dict__.copy()
+        state['keys'] = {}
+        return state
+
+
+def use_token_cache(estimator, cache, docs=()):
+    """Makes the vectorizers within ``estimator`` read their tokens from
+    ``cache``, warming it up with ``docs``."""
+    params = estimator.get_params(deep=True).values() + [estimator]
+    vectorizers = [p for p in params if isinstance(p, TfidfVectorizer)]
+    for vect in vectorizers:
+        if isinstance(vect.tokenizer, CachedAnalysis):
+            continue
+        analysis = cache.analysis(vect.build_preprocessor(),
+                                  vect.build_tokenizer())
+        vect.set_params(preprocessor=passthrough, tokenizer=analysis)
+        for doc in docs:
+            analysis.token_ids(doc)
+    cache.flush()
+    return vectorizers
+
+
+def drop_token_cache(estimator):
+    """Restores the original analysis of vectorizers using a token cache,
+    i.e. before persisting a model."""
+    params = estimator.get_params(deep=True).values() + [estimator]
+    for vect in params:
+        if (isinstance(vect, TfidfVectorizer)
+                and isinstance(vect.tokenizer, CachedAnalysis)):
+            analysis = vect.tokenizer
+            vect.set_params(preprocessor=analysis.preprocessor,
+                            tokenizer=analysis.tokenizer)
@@ -1,12 +1,16 @@
+import datetime
 import random
 from cyclone import web
 from cyclone.util import ObjectDict
-from txrho.util.defer import parallel
-from twisted.internet import defer
+from twisted.internet import defer, reactor
+from twisted.internet.task import LoopingCall
 from twisted.python import log
 
 from yatiri import datastore, settings
-from yatiri.searchclient import SearchClient
+from yatiri.asyncdb import AsyncDB
+from yatiri.cache import TTLCache
+from yatiri.cursors import encode_cursor, skip_cursor
+from yatiri.searchclient import SearchClient, EmbeddedSearchClient
 from yatiri.utils import doc_summary, doc_image
 
 
@@ -19,6 +23,11 @@ SETTINGS_MAP = (
     ('template_path', 'TEMPLATE_PATH'),
 )
 
+# stored search field with the data to render a result
+DISPLAY = 'display'
+# fields rendered by the item template
+ITEM_FIELDS = ('headline', 'url', 'site', 'datetime')
+
 CATEGORY_MAP = {
     'inestabilidad': 'politica',
     'inseguridad': 'seguridad',
@@ -26,12 +35,38 @@ CATEGORY_MAP = {
 }
 
 
+def display_info(ret):
+    """Pops the display data of a search result, returned only if it has
+    every field rendered by the item template.
+
+    >>> display_info({'display': {'headline': 'h', 'url': 'u'}}) is None
+    True
+
+    """
+    info = ret.pop(DISPLAY, None)
+    if info and all(f in info for f in ITEM_FIELDS):
+        return info
+
+
+def item_summary(doc):
+    # display data carries the summary computed at index time
+    if 'summary' in doc:
+        return doc['summary']
+    return doc_summary(doc)
+
+
 class BaseHandler(web.RequestHandler):
 
     date = '2012-11-25'
     page = 1
     active_link = ''
     limit = 20
+    # order of the results without a text query
+    browse_sortby = '-date'
+    next_cursor = None
+    # store responses in the app response cache, if any
+    cacheable = True
+    _cache_key = None
 
     def get_args(self, name, default=None):
         return self.request.arguments.get(name, default)
@@ -47,16 +82,63 @@ class BaseHandler(web.RequestHandler):
 
 
     def render(self, template_name, **kwargs):
-        kwargs.setdefault('summary', doc_summary)
+        kwargs.setdefault('summary', item_summary)
         kwargs.setdefault('docimg', doc_image)
         kwargs.setdefault('active', self.is_active)
         kwargs.setdefault('current_date', self.date)
         kwargs.setdefault('page', self.page)
+        kwargs.setdefault('next_cursor', self.next_cursor)
+        kwargs.setdefault('forward_cursor', self.forward_cursor)
         return super(BaseHandler, self).render(template_name, **kwargs)
 
+    def forward_cursor(self, pages):
+        """Returns the cursor of the page ``pages`` after the current one,
+        if the results have a cursor."""
+        if not self.next_cursor:
+            return None
+        return skip_cursor(self.next_cursor, (pages - 1) * self.limit)
+
     def render_error(self, **kwargs):
+        # concurrent fetches may fail at once
+        if self._finished:
+            return
+        self._cache_key = None
         return self.render('error.html', **kwargs)
 
+    @property
+    def response_cache(self):
+        return self.settings.get('responsecache')
+
+    def cache_key(self):
+        """Returns the request path and arguments, sorted and without empty
+        values."""
+        args = tuple(sorted(
+            (name, tuple(sorted(values)))
+            for name, values in self.request.arguments.iteritems()
+            if any(values)
+        ))
+        return (self.request.path.rstrip('/') or '/', args)
+
+    def prepare(self):
+        cache = self.response_cache
+        if (cache is None or not self.cacheable
+                or self.request.method != 'GET'):
+            return
+        key = self.cache_key()
+        body = cache.get(key)
+        if body is None:
+            self._cache_key = key
+            self.set_header('X-Cache', 'MISS')
+        else:
+            self.set_header('X-Cache', 'HIT')
+            self.finish(body)
+
+    def finish(self, chunk=None):
+        if (self._cache_key is not None and chunk is not None
+                and self.get_status() == 200):
+            self.response_cache[self._cache_key] = chunk
+        return super(BaseHandler, self).finish(chunk)
+
     def is_active(self, name):
         return (self.active_link == name) and 'active' or ''
 
@@ -66,62 +148,107 @@ class BaseHandler(web.RequestHandler):
 
     @property
     def corpus_db(self):
-        return self.settings['levelpool']['corpus']
+        return self.settings['corpusdb']
 
     @defer.inlineCallbacks
-    def fetch_docs(self, query, categories=()):
+    def fetch_docs(self, query, categories=(), cursor=None):
+        try:
+            data = yield self.client.search(
+                **self.search_args(query, categories, cursor))
+        except Exception as e:
+            self.logerr('error while retrieveing results for {!r}'.format(query))
+            self.render_error()
+            defer.returnValue(None)
+
+        result = yield self.load_docs(data)
+        defer.returnValue(result)
+
+    def search_args(self, query, categories=(), cursor=None):
         page = self.get_arg('page', self.page)
         try:
             self.page = int(page)
         except ValueError:
             self.page = 1
 
-        offset = self.limit * (self.page - 1)
-        try:
-            data = yield self.client.search(query, categories,
-                                            offset=offset, limit=self.limit)
-        except Exception as e:
-            self.logerr('error while retrieveing results for {!r}'.format(query))
-            self.render_error()
-            defer.returnValue(None)
+        # the cursor, if any, takes precedence over the page offset
+        if cursor is None:
+            cursor = self.get_arg('cursor')
+        return dict(
+            query=query,
+            categories=categories,
+            offset=self.limit * (self.page - 1),
+            limit=self.limit,
+            sortby=None if query else self.browse_sortby,
+            cursor=cursor,
+            fields=[DISPLAY],
+        )
 
+    @defer.inlineCallbacks
+    def load_docs(self, data):
+        """Returns the total and documents of the search results."""
         if 'error' in data:
             self.logerr('error from search search: {!r}'.format(data))
             self.render_error()
             defer.returnValue(None)
 
+        # documents without complete display data are read from the corpus
+        displays = [display_info(ret) for ret in data['docs']]
+        keys = [ret['id'] for ret, info in zip(data['docs'], displays)
+                if not info]
+        infos = {}
+        if keys:
+            values = yield self.corpus_db.multi_get(keys)
+            infos = dict(zip(keys, values))
+
         results = []
-        for ret in data['docs']:
-            info = self.corpus_db.get(ret['id'])
+        for ret, info in zip(data['docs'], displays):
             if not info:
-                self.log('document key without record {!r}'.format(ret))
-                continue
-            if any(f not in info for f in ('headline', 'body', 'url')):
-                self.log("Document with missing fields: {!r}".format(info))
-                break
+                info = infos.get(ret['id'])
+                if not info:
+                    self.log('document key without record {!r}'.format(ret))
+                    continue
+                if any(f not in info for f in ('headline', 'body', 'url')):
+                    self.log("Document with missing fields: {!r}".format(info))
+                    break
             doc = ObjectDict((k,v) for (k,v) in ret.items()
                              if not k.startswith('_'))
             doc.update(info)
             results.append(doc)
 
+        self.next_cursor = data.get('cursor')
         defer.returnValue((data['total'], results))
 
 
 class IndexHandler(BaseHandler):
 
     active_link = 'home'
+    # show news of a random day within these days before ``date``
+    random_days = 365
 
     @defer.inlineCallbacks
     def get(self):
         cats = ['seguridad', 'conflictos', 'politica']
         labels = ['Inseguridad Ciudadana', 'Conflictos Sociales', 'Inestabilidad Pol&iacute;tica']
-        #ret1 = yield parallel(cats, 3, lambda c: self.fetch_docs('', [c]))
-        self.page = random.randint(100,800)
         self.limit = 3
-        results = []
-        for c in cats:
-            r = yield self.fetch_docs('', [c])
-            results.append(r[1])
+        # start from a random day instead of ranking up to a deep page
+        day = datetime.datetime.strptime(self.date, '%Y-%m-%d')
+        day -= datetime.timedelta(days=random.randint(0, self.random_days))
+        cursor = encode_cursor(value=day.strftime('%Y-%m-%d'), seen=0)
+        # all the categories in one search request
+        queries = [self.search_args('', [c], cursor) for c in cats]
+        try:
+            datas = yield self.client.multi_search(queries)
+        except Exception:
+            self.logerr('error while retrieving the home page results')
+            self.render_error()
+            return
+        results = yield defer.gatherResults([
+            self.load_docs(data) for data in datas
+        ], consumeErrors=True)
+        if None in results:
+            # error already rendered
+            return
+        results = [r[1] for r in results]
         self.render('index.html',
             labels=dict(zip(cats, labels)),
             data=zip(cats, results),
@@ -185,19 +312,90 @@ class CategoryHandler(SearchHandler):
             self.render("category_list.html", **kwargs)
 
 
+class CacheStatsHandler(BaseHandler):
+
+    cacheable = False
+
+    def get(self):
+        stats = self.settings['generationwatcher'].stats()
+        stats.update(self.response_cache.stats())
+        self.finish(stats)
+
+
+class GenerationWatcher(object):
+    """Polls the search service and clears the response cache when the
+    index generation changes."""
+
+    def __init__(self, client, cache, interval):
+        self.client = client
+        self.cache = cache
+        self.interval = interval
+        self.generation = None
+        self.invalidations = 0
+        self.loop = LoopingCall(self.check)
+
+    def start(self):
+        self.loop.start(self.interval, now=True)
+
+    @defer.inlineCallbacks
+    def check(self):
+        try:
+            status = yield self.client.status()
+        except Exception:
+            log.err(system=self.__class__.__name__)
+            return
+        generation = status.get('generation')
+        if generation != self.generation:
+            if self.generation is not None:
+                log.msg('index generation {} -> {}'.format(
+                    self.generation, generation))
+                self.invalidations += 1
+            self.generation = generation
+            self.cache.clear()
+
+    def stats(self):
+        return {
+            'generation': self.generation,
+            'invalidations': self.invalidations,
+        }
+
+
 def get_app():
     handlers = [
         (r'/', IndexHandler),
         (r'/browse/?', BrowseHandler),
         (r'/search/?', SearchHandler),
         (r'/({})/?'.format(r'|'.join(CATEGORY_MAP.keys())), CategoryHandler),
+        (r'/_stats/cache', CacheStatsHandler),
     ]
     app_settings = dict(
         (k, getattr(settings, v.upper())) for (k,v) in SETTINGS_MAP
     )
     # leveldb
     app_settings['levelpool'] = datastore.pool
+    corpusdb = AsyncDB(datastore.corpus_db(),
+                       maxthreads=settings.LEVELDB_THREADS)
+    reactor.callWhenRunning(corpusdb.start)
+    app_settings['corpusdb'] = corpusdb
     # search
-    app_settings['searchclient'] = SearchClient(settings.SEARCH_ENDPOINT)
+    if settings.SEARCH_EMBEDDED:
+        client = EmbeddedSearchClient(settings.XAPIAN_DB)
+        reactor.callWhenRunning(client.start)
+    else:
+        client = SearchClient(settings.SEARCH_ENDPOINT,
+                              pool_size=settings.SEARCH_POOL_SIZE,
+                              connect_timeout=settings.SEARCH_CONNECT_TIMEOUT,
+                              idle_timeout=settings.SEARCH_IDLE_TIMEOUT,
+                              timeout=settings.SEARCH_TIMEOUT)
+        reactor.addSystemEventTrigger('before', 'shutdown', client.close)
+    app_settings['searchclient'] = client
+    # rendered pages, cleared on index updates
+    cache = TTLCache(settings.RESPONSE_CACHE_SIZE,
+                     ttl=settings.RESPONSE_CACHE_TTL)
+    watcher = GenerationWatcher(client, cache,
+                                settings.GENERATION_POLL_INTERVAL)
+    reactor.callWhenRunning(watcher.start)
+    app_settings['responsecache'] = cache
+    app_settings['generationwatcher'] = watcher
 
     return web.Application(handlers, **app_settings)